@@ -1,19 +1,28 @@
 from collections import OrderedDict, deque
 import colorsys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import hashlib
 import heapq
 import json
+import math
 import os
 import matplotlib.animation as animation
 import random
-from typing import Callable, Literal
+import time
+from typing import Callable, Iterator, Literal
 import cv2
 from matplotlib import pyplot as plt
 import numpy as np
-from numpy import ndarray, zeros_like
+from numpy import ndarray
 import pygame
-from scipy import signal
+from scipy import ndimage, sparse
+from scipy.sparse import linalg as splinalg
+from scipy.sparse.csgraph import dijkstra
 from tqdm import tqdm
 
+# tqdmによる進捗表示を行うかどうか（並列生成のワーカープロセスでは無効にします）
+SHOW_PROGRESS = True
+
 
 def is_json_serializable(obj) -> bool:
     """
@@ -163,7 +172,409 @@ def draw_monster_shape(surface, P, S, Rc:float, theta:float|tuple[float,float],
                 glow_surface, (P[0] - S*D[0]/6 - S/2, P[1] - S*D[1]/6 - S/2))
 
 
+class CellSampler:
+    """
+    セルの集合をキー（領域ラベルまたは壁ラベル）ごとに配列と位置表で保持し、
+    キーに属するセルを一様にランダム抽出します。
+    追加と削除は末尾との入れ替え（swap-remove）で行うため、追加・削除はいずれもO(1)です。
+
+    抽出は find_random_position と同じように、キーに属するセルを平坦化したインデックスの順（np.argwhere の順）に並べたときの
+    np.random.randint 番目のセルを選ぶため、同じシードからは find_random_position と同じセルが選ばれます。
+    そのためにキーごとにセルをブロック（block 個の連続したセル）単位で数えておき、
+    何番目のセルがどのブロックにあるかを累積和で求めて、そのブロックの中だけを走査します。
+    キーの最初のセル（first）も同じように求め、変わるまで保持します。
+    """
+    def __init__(self, keys: ndarray, block: int | None = None) -> None:
+        """
+        引数:
+            keys (ndarray): 各セルのキー（壁のセルは壁ラベル、通路のセルは領域ラベル）
+            block (int | None): 数をまとめるセルの数（デフォルト: セルの数の平方根）
+        """
+        keys = keys.ravel()
+        self.size = keys.size
+        self.block = max(1, math.isqrt(keys.size)) if block is None else block
+        self.block_count = -(-keys.size // self.block)
+        self.slot = np.empty(keys.size, dtype=np.int64)
+        self.groups: dict[int, ndarray] = {}
+        self.counts: dict[int, int] = {}
+        self.blocks: dict[int, ndarray] = {}
+        self.firsts: dict[int, int] = {}
+        order = np.argsort(keys, kind='stable')
+        uniq_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        for key, start, count in zip(uniq_keys.tolist(), starts.tolist(), counts.tolist()):
+            cells = order[start:start + count].astype(np.int64)
+            self.slot[cells] = np.arange(count)
+            self.groups[key] = cells
+            self.counts[key] = count
+            self.blocks[key] = np.bincount(cells // self.block, minlength=self.block_count)
+
+    def count(self, key: int) -> int:
+        return self.counts.get(key, 0)
+
+    def reserve(self, key: int, size: int) -> ndarray:
+        cells = self.groups.setdefault(key, np.empty(0, dtype=np.int64))
+        if cells.size < size:
+            cells = np.concatenate([cells, np.empty(max(size, cells.size * 2) - cells.size, dtype=np.int64)])
+            self.groups[key] = cells
+        return cells
+
+    def key_blocks(self, key: int) -> ndarray:
+        blocks = self.blocks.get(key)
+        if blocks is None:
+            blocks = self.blocks[key] = np.zeros(self.block_count, dtype=np.int64)
+        return blocks
+
+    def add(self, key: int, cell: int):
+        count = self.count(key)
+        cells = self.reserve(key, count + 1)
+        cells[count] = cell
+        self.slot[cell] = count
+        self.counts[key] = count + 1
+        self.key_blocks(key)[cell // self.block] += 1
+        if key in self.firsts:
+            self.firsts[key] = min(self.firsts[key], cell)
+
+    def remove(self, key: int, cell: int):
+        cells = self.groups[key]
+        last = self.counts[key] - 1
+        index = self.slot[cell]
+        moved = cells[last]
+        cells[index] = moved
+        self.slot[moved] = index
+        self.counts[key] = last
+        self.blocks[key][cell // self.block] -= 1
+        if self.firsts.get(key) == cell:
+            del self.firsts[key]
+
+    def move(self, from_key: int, to_key: int, cells: ndarray):
+        """
+        cellsをfrom_keyからto_keyへ移動します。
+        """
+        for cell in cells.tolist():
+            self.remove(from_key, cell)
+        count = self.count(to_key)
+        group = self.reserve(to_key, count + cells.size)
+        group[count:count + cells.size] = cells
+        self.slot[cells] = np.arange(count, count + cells.size)
+        self.counts[to_key] = count + cells.size
+        np.add.at(self.key_blocks(to_key), cells // self.block, 1)
+        if to_key in self.firsts and cells.size > 0:
+            self.firsts[to_key] = min(self.firsts[to_key], cells.min().item())
+
+    def merge(self, keep_key: int, merged_key: int):
+        """
+        merged_keyのセルをすべてkeep_keyへ移します。少ない方のセルだけを書き換えます。
+        """
+        merged_count = self.counts.pop(merged_key, 0)
+        merged_cells = self.groups.pop(merged_key, None)
+        merged_blocks = self.blocks.pop(merged_key, None)
+        merged_first = self.firsts.pop(merged_key, None)
+        if merged_count == 0:
+            return
+        self.key_blocks(keep_key)[:] += merged_blocks
+        if merged_first is None:
+            self.firsts.pop(keep_key, None)
+        elif keep_key in self.firsts:
+            self.firsts[keep_key] = min(self.firsts[keep_key], merged_first)
+        keep_count = self.count(keep_key)
+        if keep_count < merged_count:
+            self.groups[keep_key], merged_cells = merged_cells, self.groups.get(keep_key, merged_cells[:0])
+            self.counts[keep_key] = merged_count
+            keep_count, merged_count = merged_count, keep_count
+        cells = merged_cells[:merged_count]
+        group = self.reserve(keep_key, keep_count + merged_count)
+        group[keep_count:keep_count + merged_count] = cells
+        self.slot[cells] = np.arange(keep_count, keep_count + merged_count)
+        self.counts[keep_key] = keep_count + merged_count
+
+    def sample(self, key: int) -> int | None:
+        """
+        keyに属するセルを一様にランダムに1つ選びます。
+
+        戻り値:
+            int | None: 選ばれたセルの平坦化したインデックス。該当するセルがない場合は None
+        """
+        count = self.count(key)
+        if count == 0:
+            return None
+        index = np.random.randint(count)
+        # index 番目のセルを含むブロックと、ブロックの中での順番を求める
+        cumulative = np.cumsum(self.blocks[key])
+        block = np.searchsorted(cumulative, index, side='right').item()
+        rank = index - (cumulative[block - 1].item() if block > 0 else 0)
+        return self.block_cells(key, block)[rank].item()
+
+    def first(self, key: int) -> int:
+        """
+        keyに属するセルのうち、平坦化したインデックスが最小のセルを返します。
+
+        戻り値:
+            int: セルの平坦化したインデックス。該当するセルがない場合はセルの数
+        """
+        if key not in self.firsts:
+            if self.count(key) == 0:
+                return self.size
+            block = np.flatnonzero(self.blocks[key])[0].item()
+            self.firsts[key] = self.block_cells(key, block)[0].item()
+        return self.firsts[key]
+
+    def block_cells(self, key: int, block: int) -> ndarray:
+        """
+        ブロックの中でkeyに属するセルを、平坦化したインデックスの順に返します。
+        """
+        cells = np.arange(block * self.block, min((block + 1) * self.block, self.size))
+        # slot が key の配列の有効な範囲を指し、その位置にセル自身があれば key に属する
+        slots = self.slot[cells]
+        group = self.groups[key]
+        member = (slots < self.count(key)) & (group[np.minimum(slots, group.size - 1)] == cells)
+        return cells[member]
+
+
+class RegionTable:
+    """
+    ラベルごとの領域サイズ表（bincount形式の配列）と、ラベル統合用の素集合森（Union-Find）を保持します。
+    set_wall や delete_wall がセル単位の変更に合わせて逐次更新するため、
+    領域サイズの参照やラベルの統合に全体走査を必要としません。
+
+    統合されたラベルはラベル配列を書き換えずに親ラベルを辿って解決します（find）。
+    代表ラベルで書き換えたラベル配列が必要な場合は canonical を呼び出します。
+
+    fieldを渡した場合は、壁のセルと領域ごとの通路のセルを CellSampler で索引し、
+    auto_set が変更するセルをO(1)で抽出できるようにします。
+    """
+    def __init__(self, labels: ndarray, field: ndarray | None = None) -> None:
+        """
+        引数:
+            labels (ndarray): 各セルのラベル（get_labels の戻り値と同じ形式）
+            field (ndarray | None): フィールド（オプション）。指定するとセルの抽出用の索引を作成します
+        """
+        self.sizes = np.bincount(labels.ravel()).astype(np.int64)
+        self.parent = np.arange(self.sizes.size)
+        self.next_label = self.sizes.size
+        self.sampler = None if field is None else CellSampler(
+            np.where(field == 1, Constant.WALL_LABEL, labels))
+
+    def new_label(self) -> int:
+        """
+        未使用のラベルを払い出します。必要に応じてサイズ表を拡張します。
+
+        戻り値:
+            int: 新しいラベル
+        """
+        label = self.next_label
+        if label >= self.sizes.size:
+            self.sizes = np.concatenate([self.sizes, np.zeros_like(self.sizes)])
+            self.parent = np.concatenate([self.parent, np.arange(label, self.sizes.size)])
+        self.next_label += 1
+        return label
+
+    def parent_view(self) -> ndarray:
+        return self.parent[:self.next_label]
+
+    def size(self, label: int) -> int:
+        return self.sizes[self.find(label)].item()
+
+    def find(self, label: int) -> int:
+        """
+        ラベルの代表ラベルを返します。辿った経路は途中で短縮されます。
+
+        引数:
+            label (int): ラベル配列に記録されているラベル
+
+        戻り値:
+            int: 代表ラベル
+        """
+        parent = self.parent
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return int(label)
+
+    def union(self, keep_label: int, merged_label: int):
+        """
+        merged_labelの領域をkeep_labelの領域に統合します。どちらも代表ラベルである必要があります。
+
+        引数:
+            keep_label (int): 統合後に残る代表ラベル
+            merged_label (int): 統合されるラベル
+        """
+        self.parent[merged_label] = keep_label
+        self.sizes[keep_label] += self.sizes[merged_label]
+        self.sizes[merged_label] = 0
+        if self.sampler is not None:
+            self.sampler.merge(keep_label, merged_label)
+
+    def close_cell(self, label: int, cell: int):
+        """
+        領域labelに属する通路のセルを壁にします。
+
+        引数:
+            label (int): セルが属する領域の代表ラベル
+            cell (int): 平坦化したセルのインデックス
+        """
+        self.sizes[label] -= 1
+        self.sizes[Constant.WALL_LABEL] += 1
+        if self.sampler is not None:
+            self.sampler.move(label, Constant.WALL_LABEL, np.array([cell]))
+
+    def open_cell(self, label: int, cell: int):
+        """
+        壁のセルを通路にして領域labelに加えます。
+
+        引数:
+            label (int): セルを加える領域の代表ラベル
+            cell (int): 平坦化したセルのインデックス
+        """
+        self.sizes[label] += 1
+        self.sizes[Constant.WALL_LABEL] -= 1
+        if self.sampler is not None:
+            self.sampler.move(Constant.WALL_LABEL, label, np.array([cell]))
+
+    def split(self, label: int, cells: ndarray) -> int:
+        """
+        領域labelからcellsを切り離し、新しいラベルの領域にします。
+
+        引数:
+            label (int): 切り離し元の領域の代表ラベル
+            cells (ndarray): 切り離すセルの平坦化したインデックス
+
+        戻り値:
+            int: 切り離された領域の新しいラベル
+        """
+        new_label = self.new_label()
+        self.sizes[label] -= cells.size
+        self.sizes[new_label] = cells.size
+        if self.sampler is not None:
+            self.sampler.move(label, new_label, cells)
+        return new_label
+
+    def canonical(self, labels: ndarray) -> ndarray:
+        """
+        ラベル配列の各ラベルを代表ラベルに置き換えた配列を返します。
+
+        引数:
+            labels (ndarray): ラベル配列
+
+        戻り値:
+            ndarray: 代表ラベルで書き換えたラベル配列（新しい配列）
+        """
+        parent = self.parent_view()
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent[:] = grand
+        return parent[labels].astype(labels.dtype, copy=False)
+
+    def scan_order(self, route_labels: ndarray) -> ndarray:
+        """
+        ルートのラベルを、各領域の最初のセルの順（get_labels が振るラベルの番号の順）に並べ替えます。
+        セルの索引（CellSampler）が必要です。
+
+        引数:
+            route_labels (ndarray): ルートのラベル配列（代表ラベル）
+
+        戻り値:
+            ndarray: 並べ替えたルートのラベル配列
+        """
+        firsts = [self.sampler.first(label) for label in route_labels.tolist()]
+        return route_labels[np.argsort(firsts, kind='stable')]
+
+    def select_label(self, route_labels: ndarray, mode: Literal['max', 'min', 'random'] = 'max') -> int:
+        """
+        サイズ表を参照して、モードに応じた領域のラベルを選択します。
+
+        引数:
+            route_labels (ndarray): ルートのラベル配列
+            mode (Literal['max', 'min', 'random']): 選択モード（デフォルトは'max'）
+
+        戻り値:
+            int: 選択されたラベル
+        """
+        assert mode in ['max', 'min', 'random']
+        if mode == 'max':
+            return route_labels[np.argmax(self.sizes[route_labels])]
+        if mode == 'min':
+            return route_labels[np.argmin(self.sizes[route_labels])]
+        return route_labels[random.randint(0, len(route_labels)-1)]
+
+
+class FieldHistory:
+    """
+    auto_setting の in-place モードで記録される差分履歴です。
+    初期フィールドと (ステップ, セル, 変更前, 変更後) の差分ログだけを保持し、
+    途中の状態はインデックスで参照されたときに再構築します。
+    インデックスと長さはリスト形式の履歴（初期状態、各試行後の状態、ラベルを振り直した最終状態の count+2 個）と同じです。
+    1ステップで変更されるセルは高々1つなので、差分ログの大きさは試行回数で抑えられます。
+    """
+    def __init__(self, field: ndarray, count: int) -> None:
+        """
+        引数:
+            field (ndarray): 初期フィールド（コピーして保持します）
+            count (int): 試行回数
+        """
+        self.initial = field.copy()
+        self.count = count
+        self.steps = np.empty(count, dtype=np.int32)
+        self.cells = np.empty(count, dtype=np.int64)
+        self.old_values = np.empty(count, dtype=np.uint8)
+        self.new_values = np.empty(count, dtype=np.uint8)
+        self.size = 0
+        self.final: tuple[ndarray, ndarray, ndarray] | None = None
+
+    def record(self, step: int, pos: tuple[int, int], old: int, new: int):
+        """
+        セルの変更を記録します。値が変わっていない場合は記録しません。
+        """
+        if old == new:
+            return
+        self.steps[self.size] = step
+        self.cells[self.size] = np.ravel_multi_index(pos, self.initial.shape)
+        self.old_values[self.size] = old
+        self.new_values[self.size] = new
+        self.size += 1
+
+    def field_at(self, index: int) -> ndarray:
+        """
+        index回の試行を終えた時点のフィールドを再構築します。
+
+        引数:
+            index (int): 状態のインデックス（0が初期状態）
+
+        戻り値:
+            ndarray: 再構築したフィールド（新しい配列）
+        """
+        n = np.searchsorted(self.steps[:self.size], index)
+        field = self.initial.copy()
+        # 同じセルが複数回変更されている場合は最後の変更だけを反映する
+        cells = self.cells[:n][::-1]
+        cells, last = np.unique(cells, return_index=True)
+        field.flat[cells] = self.new_values[:n][::-1][last]
+        return field
+
+    def __len__(self) -> int:
+        # 初期状態、count回の各試行後の状態、ラベルを振り直した最終状態（リスト形式の履歴と同じ並び）
+        return self.count + 2
+
+    def __getitem__(self, index: int) -> tuple[ndarray, ndarray, ndarray]:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        # count回の試行後の状態と最終状態はフィールドが同じなので、どちらも最終状態を返す
+        if index >= self.count and self.final is not None:
+            return self.final
+        field = self.field_at(index)
+        route_labels, labels, _ = Constant.get_labels(field)
+        return field, route_labels, labels
+
+
 class Constant:
+    # cv2.connectedComponentsで背景（壁）に割り当てられるラベル
+    WALL_LABEL = 0
+    # RotLabel の番号順に並べた周囲8セルの相対位置
+    SURROUNDING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+
     def __init__(self) -> None:
         RotMasks = []
         S1 = np.array(
@@ -203,6 +614,14 @@ class Constant:
              [0,1,0]],
             dtype=np.bool_
         )
+        # 周囲8セルの壁の有無を RotLabel の番号順にビットへ詰めた値から、潜在的なスプリッターかどうかを引く表
+        splitter_table = []
+        for code in range(256):
+            extracted_field = np.zeros((3, 3), dtype=int)
+            for bit, (di, dj) in enumerate(self.SURROUNDING_OFFSETS):
+                extracted_field[1 + di, 1 + dj] = (code >> bit) & 1
+            splitter_table.append(bool(self.is_potential_splitter(extracted_field)))
+        self.splitter_table = tuple(splitter_table)
     
     @classmethod
     def find_random_position(cls, field: ndarray, search_value: int = 0, mask: ndarray|None = None) -> tuple[int, int]:
@@ -233,7 +652,7 @@ class Constant:
         return selected_position
     
     @classmethod
-    def get_area_mask(cls, route_labels: ndarray, labels: ndarray, mode: Literal['max', 'min', 'random'] = 'max'):
+    def get_area_mask(cls, route_labels: ndarray, labels: ndarray, mode: Literal['max', 'min', 'random'] = 'max', regions: RegionTable | None = None):
         """
         指定されたモードに基づいて、エリアのマスクを生成します。
 
@@ -241,22 +660,18 @@ class Constant:
             route_labels (ndarray): ルートのラベル配列
             labels (ndarray): 全体のラベル配列
             mode (Literal['max', 'min', 'random']): 選択モード（デフォルトは'max'）
+            regions (RegionTable | None): 領域サイズ表（オプション）。省略時はlabelsから作成します
 
         戻り値:
             tuple: (選択されたエリアのマスク, 選択されたラベル)
         """
-        assert mode in ['max', 'min', 'random']
-        area_sizes = [np.sum(labels == rl) for rl in route_labels]
-        if mode == 'max':
-            selected_label = route_labels[np.argmax(area_sizes)]
-        elif mode == 'min':
-            selected_label = route_labels[np.argmin(area_sizes)]
-        else:
-            selected_label = route_labels[random.randint(0,len(route_labels)-1)]
-        return labels == selected_label, selected_label
+        if regions is None:
+            regions = RegionTable(labels)
+        selected_label = regions.select_label(route_labels, mode)
+        return regions.canonical(labels) == selected_label, selected_label
     
     @classmethod
-    def extract_surrounding_efficient(cls, pos: tuple[int, int], field: ndarray, return_generator: bool = False, pad_value: int = 1):
+    def extract_surrounding_efficient(cls, pos: tuple[int, int], field: ndarray, return_generator: bool = False, pad_value: int = 1, return_code: bool = False):
         """
         指定された位置を中心とする3x3の領域をフィールドから効率的に抽出します。
 
@@ -265,15 +680,32 @@ class Constant:
             field (np.ndarray): 2次元のnumpy配列
             return_generator (bool): ジェネレータを返すかどうか（デフォルトはFalse）
             pad_value (int): 境界外を埋める値（デフォルトは1）
+            return_code (bool): 3x3の配列の代わりに、周囲8セルが1かどうかを
+                SURROUNDING_OFFSETS の順にビットへ詰めた整数を返すかどうか（デフォルトはFalse）
 
         戻り値:
             np.ndarray: 3x3の抽出された領域
             境界外の場合はパディングとしてpad_valueが使用されます。
             return_generatorがTrueの場合は、抽出された領域とジェネレータ関数のタプルを返します。
+            return_codeがTrueの場合は、周囲8セルを詰めた整数（0-255）を返します。
         """
         row, col = pos
         rows, cols = field.shape
 
+        if return_code:
+            if 0 < row < rows - 1 and 0 < col < cols - 1:
+                # 境界に接していない場合は配列を作らずに直接ビットへ詰める
+                (c0, c1, c2), (c7, _, c3), (c6, c5, c4) = field[row-1:row+2, col-1:col+2].tolist()
+                return ((c0 == 1) | (c1 == 1) << 1 | (c2 == 1) << 2 | (c3 == 1) << 3 |
+                        (c4 == 1) << 4 | (c5 == 1) << 5 | (c6 == 1) << 6 | (c7 == 1) << 7)
+            code = 0
+            for bit, (di, dj) in enumerate(cls.SURROUNDING_OFFSETS):
+                i, j = row + di, col + dj
+                value = field.item(i, j) if 0 <= i < rows and 0 <= j < cols else pad_value
+                if value == 1:
+                    code |= 1 << bit
+            return code
+
         # 抽出する領域の範囲を計算
         row_start = max(0, row - 1)
         row_end = min(rows, row + 2)
@@ -314,6 +746,18 @@ class Constant:
         if not field_mask.any():
             return False
         return np.sum(field_mask & (np.sum(self.RotMasks[self.RotLabel[field_mask]], axis=0)>0)) > 0
+
+    def is_potential_splitter_code(self, code: int) -> bool:
+        """
+        is_potential_splitter を表引きで判定します。中心のセルは通路であるとみなします。
+
+        引数:
+            code (int): extract_surrounding_efficient(return_code=True) で得た周囲8セルの値
+
+        戻り値:
+            bool: 潜在的なスプリッターである場合はTrue、そうでない場合はFalse
+        """
+        return self.splitter_table[code]
     
     @classmethod
     def get_labels(cls, field: ndarray):
@@ -331,42 +775,110 @@ class Constant:
         wall_labels = np.argwhere(field == 1)
         wall_label = (-1) if wall_labels.size == 0 else labels[*wall_labels[0]].item()
         route_labels = np.array(
-            [rval for rval in range(retval) if rval != wall_label])
+            [rval for rval in range(retval) if rval != wall_label], dtype=np.int32)
         return route_labels, labels, wall_label
-    
-    def set_wall(self, pos: tuple[int, int], field: ndarray, min_size: int, route_labels: ndarray | None = None, labels: ndarray | None = None):
+
+    @classmethod
+    def split_pieces(cls, pos: tuple[int, int], field: ndarray) -> list[list[tuple[int, int]]]:
+        """
+        posを壁にしたときに領域から切り離される部分を局所的に探索します。
+        posの上下左右の通路セルから同時に幅優先探索を行い、探索同士が出会った時点で合流させます。
+        探索し尽くされた部分が切り離された部分となり、最後まで残った部分は元のラベルを引き継ぎます。
+
+        引数:
+            pos (tuple[int, int]): 壁にするセルの(行, 列)座標
+            field (ndarray): 現在のフィールド（posはまだ通路）
+
+        戻り値:
+            list[list[tuple[int, int]]]: 切り離される部分ごとのセル座標のリスト
+            分割されない場合は空のリストを返します。
+        """
+        rows, cols = field.shape
+        directions = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+        starts = [(pos[0] + di, pos[1] + dj) for di, dj in directions
+                  if 0 <= pos[0] + di < rows and 0 <= pos[1] + dj < cols and field.item(pos[0] + di, pos[1] + dj) == 0]
+        owner = {start: k for k, start in enumerate(starts)}
+        owner[pos] = -1
+        roots = list(range(len(starts)))
+        queues = [deque([start]) for start in starts]
+        cells = [[start] for start in starts]
+        active = set(roots)
+
+        def find(k):
+            while roots[k] != k:
+                k = roots[k]
+            return k
+
+        pieces = []
+        while len(active) > 1:
+            # 最も小さい探索から進めることで、切り離される側の大きさに比例した計算量に抑える
+            k = min(active, key=lambda r: len(cells[r]))
+            if not queues[k]:
+                active.remove(k)
+                pieces.append(cells[k])
+                continue
+            i, j = queues[k].popleft()
+            for di, dj in directions:
+                ni, nj = i + di, j + dj
+                if not (0 <= ni < rows and 0 <= nj < cols) or field.item(ni, nj) != 0:
+                    continue
+                o = owner.get((ni, nj))
+                if o is None:
+                    owner[(ni, nj)] = k
+                    queues[k].append((ni, nj))
+                    cells[k].append((ni, nj))
+                elif o >= 0 and (r := find(o)) != k:
+                    # 探索同士が出会ったので合流
+                    roots[r] = k
+                    queues[k].extend(queues[r])
+                    cells[k].extend(cells[r])
+                    active.remove(r)
+        return pieces
+
+    def set_wall(self, pos: tuple[int, int], field: ndarray, min_size: int, route_labels: ndarray | None = None, labels: ndarray | None = None, regions: RegionTable | None = None, inplace: bool = False):
         if labels is None:
             route_labels, labels, _ = self.get_labels(field)
         elif route_labels is None:
             route_labels = np.unique(labels[field == 0])
         if field[*pos] == 1:
             return True, field, route_labels, labels
-        if np.sum(labels == labels[*pos].item()) - 1 < min_size:
+        materialize = regions is None
+        if regions is None:
+            regions = RegionTable(labels)
+        label = regions.find(labels[*pos].item())
+        region_size = regions.size(label)
+        if region_size - 1 < min_size:
             return False, field, route_labels, labels
-        extracted_field, generator = self.extract_surrounding_efficient(
-            pos, field, return_generator=True)
-        pred_field = field.copy()
+        pieces = []
+        splitter = self.is_potential_splitter_code(self.extract_surrounding_efficient(pos, field, return_code=True))
+        if splitter:
+            pieces = self.split_pieces(pos, field)
+            remain_size = region_size - 1 - sum(len(piece) for piece in pieces)
+            if remain_size < min_size or any(len(piece) < min_size for piece in pieces):
+                return False, field, route_labels, labels
+        # 従来は分割しうるセルか壁のないフィールドでは get_labels でラベルを振り直していたため、
+        # 表を渡されていない場合は同じラベルの番号を、表がある場合は同じルートのラベルの順番を返す
+        # （select_label で同じ大きさの領域から選ぶ順番が変わらないようにする）
+        relabel = splitter or regions.sizes[self.WALL_LABEL] == 0
+        pred_field, pred_field_labels = (field, labels) if inplace else (field.copy(), labels.copy())
         pred_field[*pos] = 1
-        pred_field_labels = labels.copy()
-        wall_labels = np.argwhere(field == 1)
-        if wall_labels.size == 0:
-            pred_route_labels, pred_field_labels, _ = self.get_labels(
-                pred_field)
-            return True, pred_field, pred_route_labels, pred_field_labels
-        wall_label = pred_field_labels[*wall_labels[0]].item()
-        pred_field_labels[*pos] = wall_label
-        pred_route_labels = route_labels.copy()
-        if self.is_potential_splitter(extracted_field):
-            pred_route_labels, pred_field_labels, wall_label = self.get_labels(
-                pred_field)
-            # print(f"Try to Update Labels")
-            for ul in pred_route_labels:
-                if np.sum(pred_field_labels == ul) < min_size:
-                    # print(f"Failed Update Labels")
-                    return False, field, route_labels, labels
+        pred_field_labels[*pos] = self.WALL_LABEL
+        pred_route_labels = route_labels[route_labels != self.WALL_LABEL]
+        regions.close_cell(label, np.ravel_multi_index(pos, field.shape))
+        for piece in pieces:
+            cells = np.ravel_multi_index(tuple(np.array(piece).T), field.shape)
+            new_label = regions.split(label, cells)
+            pred_field_labels.flat[cells] = new_label
+            pred_route_labels = np.append(pred_route_labels, new_label)
+        if materialize and relabel:
+            pred_route_labels, pred_field_labels[...], _ = self.get_labels(pred_field)
+        elif materialize:
+            pred_field_labels[...] = regions.canonical(pred_field_labels)
+        elif relabel and regions.sampler is not None:
+            pred_route_labels = regions.scan_order(pred_route_labels)
         return True, pred_field, pred_route_labels, pred_field_labels
     
-    def delete_wall(self, pos: tuple[int, int], field: ndarray, route_labels: ndarray | None = None, labels: ndarray | None = None):
+    def delete_wall(self, pos: tuple[int, int], field: ndarray, route_labels: ndarray | None = None, labels: ndarray | None = None, regions: RegionTable | None = None, inplace: bool = False):
         if labels is None:
             route_labels, labels, _ = self.get_labels(field)
         elif route_labels is None:
@@ -378,42 +890,76 @@ class Constant:
         mask = self.neighbor_mask & (extracted_field == 0)
         if not mask.any():
             return False, field, route_labels, labels
-        pred_field_labels = labels.copy()
-        uniq_labels = np.unique(generator(labels)[mask])
-        wall_label = labels[*np.argwhere(field == 1)[0]].item()
-        uniq_labels = uniq_labels[uniq_labels != wall_label]
-        min_label = np.min(uniq_labels)
-        del_labels = uniq_labels[uniq_labels != min_label]
-        pred_route_labels = np.array(
-              [rl for rl in route_labels if not rl in del_labels])
+        materialize = regions is None
+        if regions is None:
+            regions = RegionTable(labels)
+        pred_field, pred_field_labels = (field, labels) if inplace else (field.copy(), labels.copy())
+        uniq_labels = {regions.find(l) for l in generator(labels)[mask].tolist()}
+        uniq_labels.discard(self.WALL_LABEL)
+        min_label = min(uniq_labels)
+        del_labels = uniq_labels - {min_label}
+        # 統合した領域は、統合した領域のうちルートのラベルで最も前にあった位置に置く
+        pred_route_labels = []
+        placed = False
+        for rl in route_labels.tolist():
+            if rl in uniq_labels:
+                if placed:
+                    continue
+                rl, placed = min_label, True
+            pred_route_labels.append(rl)
+        pred_route_labels = np.array(pred_route_labels, dtype=route_labels.dtype)
         for dl in del_labels:
             # print(f"Delete Label {dl}")
-            pred_field_labels[pred_field_labels == dl] = min_label
+            regions.union(min_label, dl)
         pred_field_labels[*pos] = min_label
-        pred_field = field.copy()
+        regions.open_cell(min_label, np.ravel_multi_index(pos, field.shape))
         pred_field[*pos] = 0
+        if materialize:
+            pred_field_labels[...] = regions.canonical(pred_field_labels)
         return True, pred_field, pred_route_labels, pred_field_labels
     
-    def auto_set(self, field: ndarray, value: int, min_size: int, route_labels: ndarray | None = None, labels: ndarray | None = None):
+    def select_position(self, field: ndarray, value: int, route_labels: ndarray, labels: ndarray, regions: RegionTable):
+        """
+        auto_set で変更するセルを選択します。
+
+        引数:
+            field (ndarray): 現在のフィールド
+            value (int): 設定する値（0: 壁を削除, 1: 壁を設置）
+            route_labels (ndarray): ルートのラベル
+            labels (ndarray): 各セルのラベル
+            regions (RegionTable): 領域サイズ表。セルの索引を持つ場合はフィールドを走査せずに抽出します
+
+        戻り値:
+            tuple[int, int] | None: 選択されたセルの(行, 列)座標。候補がない場合は None
+        """
+        if regions.sampler is not None:
+            key = self.WALL_LABEL if value == 0 else regions.select_label(route_labels, 'max')
+            cell = regions.sampler.sample(key)
+            return None if cell is None else divmod(cell, field.shape[1])
+        if value == 0:
+            field_mask = field == 1
+        else:
+            field_mask, selected_label = self.get_area_mask(route_labels,labels,mode='max',regions=regions)
+            # print(f"Size is {regions.size(selected_label)}")
+        return self.find_random_position(field, 1-value, field_mask)
+
+    def auto_set(self, field: ndarray, value: int, min_size: int, route_labels: ndarray | None = None, labels: ndarray | None = None, regions: RegionTable | None = None, inplace: bool = False):
         if labels is None:
             route_labels, labels, _ = self.get_labels(field)
         elif route_labels is None:
             route_labels = np.unique(labels[field == 0])
-        if value == 0:
-            field_mask = field == 1
-        else:
-            field_mask, selected_label = self.get_area_mask(route_labels,labels,mode='max')
-            # print(f"Size is {np.sum(labels == selected_label).item()}")
-        pos = self.find_random_position(field, 1-value, field_mask)
+        # 表を渡されていない場合は、set_wall と delete_wall も表なしで呼んでラベルを書き換えた状態で返す
+        table = RegionTable(labels) if regions is None else regions
+        pos = self.select_position(field, value, route_labels, labels, table)
         if pos is None:
             return field, route_labels, labels
         if value == 0:
             # print(f"delete wall")
-            return self.delete_wall(pos, field, route_labels, labels)[1:]
+            return self.delete_wall(pos, field, route_labels, labels, regions, inplace)[1:]
         # print(f"set wall")
-        return self.set_wall(pos, field, min_size, route_labels, labels)[1:]
+        return self.set_wall(pos, field, min_size, route_labels, labels, regions, inplace)[1:]
     
-    def auto_setting(self, field: ndarray, min_size: int, count: int=100, route_labels: ndarray | None = None, labels: ndarray | None = None):
+    def auto_setting(self, field: ndarray, min_size: int, count: int=100, route_labels: ndarray | None = None, labels: ndarray | None = None, inplace: bool = False):
         """
         フィールドの自動設定を行います。壁の配置や空間の調整を指定された回数行います。
 
@@ -423,16 +969,21 @@ class Constant:
             count (int): 設定を試行する回数（デフォルト: 100）
             route_labels (ndarray | None): ルートのラベル（オプション）
             labels (ndarray | None): 各セルのラベル（オプション）
+            inplace (bool): Trueの場合、fieldとlabelsを直接書き換えて生成し、履歴を差分ログとして記録します（デフォルト: False）
+                途中の状態を逐次受け取る場合は iter_auto_setting を使用してください
 
         戻り値:
-            list: 各試行後のフィールド状態のリスト
+            list | FieldHistory: 各試行後のフィールド状態のリスト
+            途中の状態のラベルは統合前のラベルを含みます（RegionTable.canonical で代表ラベルに変換できます）。
+            最後の状態のラベルは get_labels で振り直したものです。
+            inplaceがTrueの場合は、同じようにインデックスで各状態を取り出せる FieldHistory を返します。
 
         使用例:
             import numpy as np
             from tqdm import tqdm
 
             # 初期フィールドの作成（全て通路）
-            field = np.zeros((30, 30))
+            field = np.zeros((30, 30), dtype=np.uint8)
 
             # Constantクラスのインスタンス化
             c = Constant()
@@ -466,13 +1017,156 @@ class Constant:
             route_labels, labels, _ = self.get_labels(field)
         elif route_labels is None:
             route_labels = np.unique(labels[field == 0])
+        if inplace:
+            hist = FieldHistory(field, count)
+            for _, field, route_labels, labels, _ in self.iter_auto_setting(field, min_size, count, route_labels, labels, every=max(count, 1), history=hist):
+                pass
+            hist.final = (field, route_labels, labels)
+            return hist
+        regions = RegionTable(labels, field)
         hist = [(field, route_labels, labels)]
-        for _ in tqdm(range(count), desc="Auto Setting Progress", ncols=100):
+        for _ in tqdm(range(count), desc="Auto Setting Progress", ncols=100, disable=not SHOW_PROGRESS):
             hist.append(self.auto_set(
-                hist[-1][0], random.sample([0, 1], k=1, counts=[1, 10])[0], min_size, hist[-1][1], hist[-1][2]))
+                hist[-1][0], random.sample([0, 1], k=1, counts=[1, 10])[0], min_size, hist[-1][1], hist[-1][2], regions))
         r, l, _ = self.get_labels(hist[-1][0])
         hist.append((hist[-1][0], r, l))
         return hist
+
+    def iter_auto_setting(self, field: ndarray, min_size: int, count: int = 100, route_labels: ndarray | None = None, labels: ndarray | None = None, every: int = 1, history: FieldHistory | None = None) -> Iterator[tuple[int, ndarray, ndarray, ndarray, ndarray]]:
+        """
+        フィールドの自動設定を in-place で行い、every回の試行ごとに途中の状態を返すジェネレータです。
+        履歴を保持しないため、試行回数に関わらず使用メモリはフィールドの大きさ程度に収まります。
+        返されるフィールドとラベルは生成中の配列そのもの（ビュー）なので、保持する場合はコピーしてください。
+
+        引数:
+            field (ndarray): 初期フィールド（0: 通路, 1: 壁）。直接書き換えます
+            min_size (int): 最小の領域サイズ
+            count (int): 設定を試行する回数（デフォルト: 100）
+            route_labels (ndarray | None): ルートのラベル（オプション）
+            labels (ndarray | None): 各セルのラベル（オプション）。直接書き換えます
+            every (int): 状態を返す間隔（デフォルト: 1）
+            history (FieldHistory | None): 指定した場合は各試行の変更を記録します（オプション）
+
+        戻り値:
+            Iterator[tuple[int, ndarray, ndarray, ndarray, ndarray]]:
+            (試行済みの回数, フィールド, ルートのラベル, 各セルのラベル, 各ルートの領域サイズ)
+            最初に初期状態（0回）を返し、最後に get_labels でラベルを振り直した最終状態（count回）を返します。
+            途中の状態のラベルは統合前のラベルを含みます（ルートのラベルは代表ラベルです）。
+
+        使用例:
+            import matplotlib.pyplot as plt
+
+            field = np.zeros((30, 30), dtype=np.uint8)
+            fig, ax = plt.subplots()
+            im = ax.imshow(field, cmap='binary')
+            for step, f, route_labels, labels, sizes in Constant().iter_auto_setting(field, min_size=50, count=300, every=10):
+                im.set_array(f)
+                ax.set_title(f"{step}: {len(route_labels)} areas")
+                plt.pause(0.01)
+        """
+        assert every >= 1
+        if labels is None:
+            route_labels, labels, _ = self.get_labels(field)
+        elif route_labels is None:
+            route_labels = np.unique(labels[field == 0])
+        regions = RegionTable(labels, field)
+        yield 0, field, route_labels, labels, regions.sizes[route_labels]
+        for step in tqdm(range(count), desc="Auto Setting Progress", ncols=100, disable=not SHOW_PROGRESS):
+            value = random.sample([0, 1], k=1, counts=[1, 10])[0]
+            pos = self.select_position(field, value, route_labels, labels, regions)
+            if pos is not None:
+                old = field[*pos].item()
+                if value == 0:
+                    route_labels = self.delete_wall(pos, field, route_labels, labels, regions, inplace=True)[2]
+                else:
+                    route_labels = self.set_wall(pos, field, min_size, route_labels, labels, regions, inplace=True)[2]
+                if history is not None:
+                    history.record(step, pos, old, field[*pos].item())
+            if (step + 1) % every == 0 and step + 1 < count:
+                yield step + 1, field, route_labels, labels, regions.sizes[route_labels]
+        route_labels, l, _ = self.get_labels(field)
+        labels[...] = l
+        yield count, field, route_labels, labels, np.bincount(labels.ravel())[route_labels]
+
+    def auto_setting_tiled(self, shape: tuple[int, int], min_size: int, tile_shape: tuple[int, int] = (128, 128), count_per_cell: float = 1/3, workers: int | None = None, seed: int | None = None):
+        """
+        大きなフィールドをタイルに分割して自動設定を行います。
+        各タイルは独立に（workersが1でなければプロセスプールで並列に）auto_setting を行い、
+        つなぎ合わせた後にタイルの境界のセルだけを対象として、フィールド全体の領域で最小サイズを確認しながら壁の配置を調整します。
+        タイルをつなぎ合わせても領域は統合されるだけなので、すべての領域は min_size 以上に保たれます。
+
+        引数:
+            shape (tuple[int, int]): フィールドのサイズ（高さ, 幅）
+            min_size (int): 最小の領域サイズ
+            tile_shape (tuple[int, int]): タイルのサイズ（デフォルト: (128, 128)）
+            count_per_cell (float): セルあたりの試行回数（デフォルト: 1/3、create_maze と同じ密度）
+            workers (int | None): ワーカープロセスの数（デフォルト: CPUコア数）。1の場合は並列化しません
+            seed (int | None): シード（オプション）。タイルごとに派生させたシードを使用し、
+                境界の調整には random と np.random をこのシードから派生させた値で初期化して使用します
+
+        戻り値:
+            tuple: (フィールド, ルートのラベル, 各セルのラベル)
+
+        使用例:
+            field, route_labels, labels = Constant().auto_setting_tiled((2000, 2000), min_size=50, seed=0)
+        """
+        rows, cols = shape
+        tiles = [(i, j, min(tile_shape[0], rows - i), min(tile_shape[1], cols - j))
+                 for i in range(0, rows, tile_shape[0]) for j in range(0, cols, tile_shape[1])]
+        seeds = [child.generate_state(1)[0].item() for child in np.random.SeedSequence(seed).spawn(len(tiles) + 1)]
+        jobs = [((h, w), min_size, int(h * w * count_per_cell), tile_seed) for (_, _, h, w), tile_seed in zip(tiles, seeds)]
+
+        field = np.zeros(shape, dtype=np.uint8)
+        if workers == 1:
+            for (i, j, h, w), job in zip(tiles, jobs):
+                field[i:i+h, j:j+w] = generate_tile(*job)
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_maze_worker)
+            try:
+                for (i, j, h, w), tile_field in zip(tiles, executor.map(generate_tile, *zip(*jobs))):
+                    field[i:i+h, j:j+w] = tile_field
+            finally:
+                # タイルの生成が例外で止まった場合も、残りのタイルを取り消してワーカーを終了させる
+                executor.shutdown(cancel_futures=True)
+
+        return self.adjust_seams(field, min_size, tile_shape, count_per_cell, seeds[-1])
+
+    def adjust_seams(self, field: ndarray, min_size: int, tile_shape: tuple[int, int], count_per_cell: float = 1/3, seed: int | None = None):
+        """
+        タイルをつなぎ合わせたフィールドについて、タイルの境界に接するセルだけを対象に壁の配置を調整します（auto_setting_tiled の後半）。
+        フィールド全体の領域で最小サイズを確認しながら set_wall と delete_wall を行い、フィールドを直接書き換えます。
+
+        引数:
+            field (ndarray): タイルをつなぎ合わせたフィールド（0: 通路, 1: 壁）。直接書き換えます
+            min_size (int): 最小の領域サイズ
+            tile_shape (tuple[int, int]): タイルのサイズ
+            count_per_cell (float): 境界のセルあたりの試行回数（デフォルト: 1/3）
+            seed (int | None): random と np.random に設定するシード（オプション）
+
+        戻り値:
+            tuple: (フィールド, ルートのラベル, 各セルのラベル)
+        """
+        rows, cols = field.shape
+        seam = np.zeros(field.shape, dtype=np.bool_)
+        seam[[i + d for i in range(0, rows, tile_shape[0]) for d in (-1, 0) if 0 <= i + d < rows], :] = True
+        seam[:, [j + d for j in range(0, cols, tile_shape[1]) for d in (-1, 0) if 0 <= j + d < cols]] = True
+        seam_cells = np.flatnonzero(seam)
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        route_labels, labels, _ = self.get_labels(field)
+        regions = RegionTable(labels)
+        for _ in tqdm(range(int(seam_cells.size * count_per_cell)), desc="Seam Setting Progress", ncols=100, disable=not SHOW_PROGRESS):
+            value = random.sample([0, 1], k=1, counts=[1, 10])[0]
+            pos = divmod(seam_cells[np.random.randint(seam_cells.size)].item(), cols)
+            if field[pos] != 1 - value:
+                continue
+            if value == 0:
+                route_labels = self.delete_wall(pos, field, route_labels, labels, regions, inplace=True)[2]
+            else:
+                route_labels = self.set_wall(pos, field, min_size, route_labels, labels, regions, inplace=True)[2]
+        route_labels, labels, _ = self.get_labels(field)
+        return field, route_labels, labels
     
     @classmethod
     def get_peak2D(cls, A: np.ndarray, mask: np.ndarray = None, mode: Literal['maximum', 'minimum'] = 'maximum'):
@@ -516,27 +1210,362 @@ class Constant:
             return np.full_like(x,if_zero_value)
         return reduced_x/max_x
     
+class MazeCache:
+    """
+    生成した迷路をディスクに保存するキャッシュです。
+    生成パラメータとシードのハッシュをキーとして、1つの迷路を1つの .npz ファイルに保存します。
+    ファイルの合計サイズが max_bytes を超えた場合は、最後に使われた時刻が古いものから削除します。
+
+    使用例:
+            cache = MazeCache("cache/")
+            maze, labels, start_goal_candidates = Analyzer.create_maze((30, 30), 50, seed=0, cache=cache)
+    """
+    # 生成処理の結果が変わる変更をしたときに上げることで、古いキャッシュを使わないようにします
+    VERSION = 3
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, store_analysis: bool = False) -> None:
+        """
+        引数:
+            directory (str): キャッシュを保存するディレクトリ
+            max_bytes (int): キャッシュの合計サイズの上限（バイト）
+            store_analysis (bool): 難易度と流体の到達ステップも保存するかどうか（デフォルト: False）
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.store_analysis = store_analysis
+
+    @classmethod
+    def make_key(cls, **params) -> str:
+        """
+        生成パラメータからキャッシュのキーを作成します。
+
+        戻り値:
+            str: パラメータとキャッシュのバージョンをJSONにしたもののSHA-256
+        """
+        text = json.dumps({'version': cls.VERSION, **params}, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def load(self, key: str) -> dict[str, ndarray] | None:
+        """
+        キーに対応する配列を読み込みます。読み込んだエントリは最後に使われた時刻を更新します。
+
+        戻り値:
+            dict[str, ndarray] | None: 保存されている配列。キャッシュにない場合は None
+        """
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        os.utime(path)
+        return arrays
+
+    def save(self, key: str, **arrays: ndarray):
+        """
+        配列をキーに対応するファイルへ保存し、必要であれば古いエントリを削除します。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.get_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep: str | None = None):
+        """
+        合計サイズが max_bytes 以下になるまで、最後に使われた時刻が古いエントリから削除します。
+
+        引数:
+            keep (str | None): 削除しないエントリのパス（オプション）
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+
+    def load_maze(self, key: str, with_analysis: bool = False):
+        """
+        キャッシュから create_maze の戻り値を復元します。
+
+        引数:
+            key (str): キャッシュのキー
+            with_analysis (bool): 保存した難易度と流体の到達ステップも返すかどうか（デフォルト: False）
+
+        戻り値:
+            tuple | None: (迷路のフィールド, ラベル付けされた領域, スタートとゴールの候補位置)。キャッシュにない場合は None
+            with_analysis がTrueの場合は、末尾に (難易度, 流体の到達ステップ) を加えて返します。
+            保存されていない結果（store_analysis がFalseで保存したエントリなど）は None です。
+
+        使用例:
+            cache = MazeCache("cache/", store_analysis=True)
+            maze = cache.load_maze(key, with_analysis=True)
+            if maze is not None:
+                field, labels, start_goal_candidates, difficulty, fluid = maze
+        """
+        arrays = self.load(key)
+        if arrays is None:
+            return None
+        sg_points = {}
+        for lbl, kind, pos in zip(arrays['sg_label'], arrays['sg_kind'], arrays['sg_pos']):
+            sg_points.setdefault(lbl, [np.empty((0, 2), dtype=np.int64), np.empty((0, 2), dtype=np.int64)])
+            sg_points[lbl][kind] = np.concatenate([sg_points[lbl][kind], pos[None]])
+        if with_analysis:
+            return arrays['field'], arrays['labels'], sg_points, arrays.get('difficulty'), arrays.get('fluid')
+        return arrays['field'], arrays['labels'], sg_points
+
+    def save_maze(self, key: str, field: ndarray, labels: ndarray, sg_points: dict, difficulty: ndarray | None = None, fluid: ndarray | None = None):
+        """
+        create_maze の戻り値を保存します。store_analysis がTrueの場合は難易度と流体の到達ステップも保存します。
+        """
+        sg_label, sg_kind, sg_pos = [], [], []
+        for lbl, points in sg_points.items():
+            for kind, pos in enumerate(points):
+                sg_label.extend([lbl] * len(pos))
+                sg_kind.extend([kind] * len(pos))
+                sg_pos.extend(pos)
+        arrays = {
+            'field': field.astype(np.uint8),
+            'labels': labels.astype(np.int32),
+            'sg_label': np.array(sg_label, dtype=np.int64),
+            'sg_kind': np.array(sg_kind, dtype=np.int8),
+            'sg_pos': np.array(sg_pos, dtype=np.int64).reshape(-1, 2),
+        }
+        if self.store_analysis and difficulty is not None:
+            arrays['difficulty'] = difficulty.astype(np.float32)
+        if self.store_analysis and fluid is not None:
+            arrays['fluid'] = fluid.astype(np.float32)
+        self.save(key, **arrays)
+
+
+class NeighborStencil:
+    """
+    上下左右4近傍の値の和を計算する、拡散計算の共通の演算器です。
+
+    値は周囲に1セルの余白（常に0）を付けた配列（パディング配列）に保持し、
+    余白の列も含めて1行目から最後の行までを平坦化した連続な1次元のビュー（帯）で計算します。
+    上下左右の近傍は帯を ±1, ±(幅+2) だけずらした連続なスライスになるため、
+    事前に確保したバッファと out 引数だけで、反復ごとに新しい配列を確保せずに計算できます。
+    フィールドの端は折り返さず、フィールドの外側は0として扱います。
+    帯の余白の列に書き込まれる値は意味を持たないため、呼び出し側で余白が0の配列（通路のマスクなど）を掛けて0に戻してください。
+    (N, 高さ, 幅) のように複数のフィールドを重ねた形も扱えます。各フィールドは余白の行で区切られるため、
+    すべてのフィールドを1つの帯でまとめて計算しても、フィールドどうしの値は混ざりません。
+
+    使用例:
+            stencil = NeighborStencil(field.shape)
+            values = stencil.pad(initial_values)
+            np.copyto(stencil.source_band, stencil.band(values))
+            neighbor_sum = stencil.unband(stencil.neighbor_sum())
+    """
+    def __init__(self, shape: tuple[int, ...], dtype: np.dtype = np.float64) -> None:
+        """
+        引数:
+            shape (tuple[int, ...]): フィールドのサイズ（高さ, 幅）、または重ねたフィールドの形（..., 高さ, 幅）
+            dtype (np.dtype): 値のデータ型（デフォルト: float64）
+        """
+        *batch, height, width = shape
+        self.shape = tuple(shape)
+        self.padded_shape = (*batch, height + 2, width + 2)
+        self.dtype = dtype
+        self.stride = width + 2
+        # 最初のフィールドの1行目から最後のフィールドの最後の行まで（フィールドの間の余白の行を含む）
+        self.band_size = (int(np.prod(batch, dtype=np.int64)) * (height + 2) - 2) * self.stride
+        # 近傍の和を計算する値を書き込むパディング配列と、その帯
+        self.source = self.zeros()
+        self.source_band = self.band(self.source)
+        flat = self.source.reshape(-1)
+        start, size, stride = self.stride, self.band_size, self.stride
+        # signal.convolve2d と同じ順序（下, 右, 左, 上）で加算し、結果を浮動小数点の誤差まで一致させる
+        self.neighbors = (flat[start + stride:start + stride + size], flat[start + 1:start + 1 + size],
+                          flat[start - 1:start - 1 + size], flat[start - stride:start - stride + size])
+        self.result = np.empty(self.band_size, dtype=dtype)
+
+    def zeros(self, dtype: np.dtype | None = None) -> ndarray:
+        """
+        0で初期化したパディング配列を作成します。
+        """
+        return np.zeros(self.padded_shape, dtype=self.dtype if dtype is None else dtype)
+
+    def pad(self, values: ndarray, dtype: np.dtype | None = None) -> ndarray:
+        """
+        valuesを内側に書き込んだパディング配列を作成します。
+        """
+        padded = self.zeros(values.dtype if dtype is None else dtype)
+        padded[..., 1:-1, 1:-1] = values
+        return padded
+
+    def interior(self, padded: ndarray) -> ndarray:
+        """
+        パディング配列の余白を除いた部分のビューを返します。
+        """
+        return padded[..., 1:-1, 1:-1]
+
+    def band(self, padded: ndarray) -> ndarray:
+        """
+        パディング配列の帯（1行目から最後の行までの連続な1次元のビュー）を返します。
+        重ねたフィールドの場合は、最初のフィールドの1行目から最後のフィールドの最後の行までです。
+        """
+        return padded.reshape(-1)[self.stride:self.stride + self.band_size]
+
+    def unband(self, band: ndarray) -> ndarray:
+        """
+        帯の形の配列から余白を除いた、フィールドと同じ形のビューを返します。
+        """
+        rows = band.reshape(-1, self.stride)
+        if len(self.shape) == 2:
+            return rows[:, 1:-1]
+        # 各フィールドの内側の行は (高さ+2) 行ごとに並んでいる
+        row_strides = [rows.strides[0] * (self.shape[-2] + 2)]
+        for size in reversed(self.shape[1:-2]):
+            row_strides.insert(0, row_strides[0] * size)
+        return np.lib.stride_tricks.as_strided(rows[:, 1:], shape=self.shape, strides=(*row_strides, *rows.strides))
+
+    def neighbor_sum(self, values: ndarray | None = None, out: ndarray | None = None) -> ndarray:
+        """
+        各セルの上下左右の値の和を帯の形で計算します。
+
+        引数:
+            values (ndarray | None): フィールドと同じ形の値の配列。省略した場合は source_band に書き込まれている値を使用します
+            out (ndarray | None): 結果を書き込む帯の形の配列（オプション）。省略した場合は内部のバッファに書き込みます
+
+        戻り値:
+            ndarray: 上下左右の値の和（帯の形）。内部のバッファは次の呼び出しで上書きされます
+        """
+        if values is not None:
+            self.source_band[...] = 0
+            self.interior(self.source)[...] = values
+        out = self.result if out is None else out
+        down, right, left, up = self.neighbors
+        np.add(down, right, out=out)
+        np.add(out, left, out=out)
+        np.add(out, up, out=out)
+        return out
+
+
+class FrameHistory:
+    """
+    difficulty や fluid の各ステップの状態を記録する方法（記録ポリシー）です。
+    mode によって次のように記録します。
+        'every': every ステップごとの状態をメモリに保持します（every=1 で全ステップ）
+        'none': 何も記録しません
+        'ring': every ステップごとの状態のうち、最新の capacity 個だけを保持します
+        'memmap': every ステップごとの状態を path の .npy ファイルにメモリマップして書き出します
+    記録した状態はリストと同じようにインデックスで参照でき、steps に各状態のステップ数を保持します。
+    計算の終了後は、実際に行ったステップ数を iterations に、最後に確認した残差（Analyzer.shape_residual）を residual に保持します。
+
+    使用例:
+            d_score, hist = Analyzer.difficulty(field, steps=5000, history=FrameHistory('ring', every=10, capacity=50))
+            last_frames = [hist[i] for i in range(len(hist))]
+    """
+    def __init__(self, mode: Literal['every', 'none', 'ring', 'memmap'] = 'every', every: int = 1, capacity: int = 100, path: str | None = None) -> None:
+        """
+        引数:
+            mode (Literal['every', 'none', 'ring', 'memmap']): 記録の方法（デフォルト: 'every'）
+            every (int): 記録するステップの間隔（デフォルト: 1）
+            capacity (int): 'ring' で保持する状態の数（デフォルト: 100）
+            path (str | None): 'memmap' で書き出すファイルのパス
+        """
+        assert mode in ['every', 'none', 'ring', 'memmap']
+        assert every >= 1
+        assert mode != 'memmap' or path is not None
+        self.mode = mode
+        self.every = every
+        self.capacity = capacity
+        self.path = path
+        self.frames: list[ndarray] | ndarray = []
+        self.steps: list[int] | deque[int] = []
+        self.size = 0
+        self.iterations = 0
+        self.residual = np.nan
+
+    def begin(self, count: int, shape: tuple[int, ...], dtype: np.dtype):
+        """
+        記録を開始します。以前に記録した状態は破棄されます。
+
+        引数:
+            count (int): 記録する可能性のあるステップ数の上限
+            shape (tuple[int, ...]): 状態の形
+            dtype (np.dtype): 状態のデータ型
+        """
+        self.size = 0
+        self.iterations = 0
+        self.residual = np.nan
+        self.steps = deque(maxlen=self.capacity) if self.mode == 'ring' else []
+        if self.mode == 'ring':
+            self.frames = np.empty((self.capacity, *shape), dtype=dtype)
+        elif self.mode == 'memmap':
+            self.frames = np.lib.format.open_memmap(
+                self.path, mode='w+', dtype=dtype, shape=(max(1, -(-count // self.every)), *shape))
+        else:
+            self.frames = []
+
+    def record(self, step: int, frame: ndarray):
+        """
+        ステップstepの状態を記録します。記録する場合は frame をコピーします。
+        """
+        if self.mode == 'none' or step % self.every != 0:
+            return
+        if self.mode == 'every':
+            self.frames.append(frame.copy())
+        else:
+            self.frames[self.size % len(self.frames)] = frame
+        self.steps.append(step)
+        self.size += 1
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __getitem__(self, index: int) -> ndarray:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if self.mode == 'ring':
+            index = (self.size - len(self) + index) % self.capacity
+        return self.frames[index]
+
+
 class Analyzer:
+    # create_maze で壁の配置を試行する回数と、難易度と流体の拡散のステップ数
+    MAZE_SETTING_COUNT = 300
+    MAZE_DIFFUSION_STEPS = 5000
+    # create_maze で難易度の計算に使用するソルバ（difficulty の solver を参照）
+    MAZE_DIFFICULTY_SOLVER = 'explicit'
+    # create_maze で難易度と流体の拡散を打ち切る残差の許容値（None の場合は打ち切りません）
+    MAZE_DIFFUSION_TOL = None
+    # create_maze で領域ごとの解析を並列に行うワーカーの数（1の場合は並列化しません、None の場合は CPUコア数）と種類
+    MAZE_ANALYSIS_WORKERS = 1
+    MAZE_ANALYSIS_EXECUTOR = 'thread'
+    # create_maze で難易度と流体の計算に使うデータ型（difficulty の dtype を参照）
+    MAZE_COMPUTE_DTYPE = np.float64
+
     @classmethod
     def neighbor_count(cls, field: ndarray):
         """
         各セルの隣接するオープンセルの数を計算します。
 
         引数:
-            field (ndarray): 迷路のフィールド（0がオープンセル、1が壁）
+            field (ndarray): 迷路のフィールド（0がオープンセル、1が壁）。(N, 高さ, 幅) のように重ねたフィールドも扱えます
 
         戻り値:
             ndarray: 各セルの隣接するオープンセルの数を示す配列
         """
-        kernel = np.array(
-            [[0,1,0],
-             [1,0,1],
-             [0,1,0]]
-        )
-        padded_field = np.pad(1-field, 1, mode='constant', constant_values=0)
+        stencil = NeighborStencil(field.shape)
         mask = field == 0
-        R = zeros_like(field)
-        R[mask] = signal.convolve2d(padded_field, kernel, mode='valid')[mask]
+        R = np.zeros(field.shape, dtype=np.uint8)
+        R[mask] = stencil.unband(stencil.neighbor_sum(mask))[mask]
         return R
     
     @classmethod
@@ -558,7 +1587,7 @@ class Analyzer:
         各セルのデルタスコア（隣接スコアの変化率）を計算します。
 
         引数:
-            field (ndarray): 迷路のフィールド
+            field (ndarray): 迷路のフィールド。(N, 高さ, 幅) のように重ねたフィールドも扱えます
             neighbor_score (ndarray|None): 事前計算された隣接スコア（オプション）
 
         戻り値:
@@ -566,78 +1595,219 @@ class Analyzer:
         """
         if neighbor_score is None:
             neighbor_score = cls.neighbor_score(field)
-        kernel = np.array(
-            [[0, 1, 0],
-             [1, -4, 1],
-             [0, 1, 0]]
-        )
+        stencil = NeighborStencil(field.shape)
         mask = field == 0
         R = np.zeros_like(field, dtype=float)
 
-        padded_neighbor_score = np.pad(neighbor_score, 1, mode='constant', constant_values=0)
-
-        R[mask] = signal.convolve2d(padded_neighbor_score,kernel,mode='valid')[mask]
+        # ラプラシアン（中心 -4, 上下左右 1）を signal.convolve2d と同じ順序（下, 右, 中心, 左, 上）で加算する
+        stencil.interior(stencil.source)[...] = neighbor_score
+        down, right, left, up = stencil.neighbors
+        laplacian = np.add(down, right, out=stencil.result)
+        laplacian += -4 * stencil.source_band
+        laplacian += left
+        laplacian += up
+        R[mask] = stencil.unband(laplacian)[mask]
         return R
     
     @classmethod
-    def difficulty(cls, field: np.ndarray, alpha: float = 0.5, steps: int = 1000, neighbor_score: np.ndarray | None = None, delta_score: np.ndarray | None = None, target_labels:ndarray|None=None, labels: ndarray|None=None):
+    def graph_laplacian(cls, field: ndarray):
+        """
+        通路のセルを頂点とし、上下左右に隣接する通路のセル同士を辺とするグラフのラプラシアン行列を作成します。
+        対角成分は各セルの neighbor_count です。フィールドの端では折り返しません。
+
+        引数:
+            field (ndarray): 迷路のフィールド（0がオープンセル、1が壁）
+
+        戻り値:
+            tuple[sparse.csr_matrix, ndarray]: (ラプラシアン行列, 各行に対応するセルの平坦化したインデックス)
+        """
+        mask = field == 0
+        cells = np.flatnonzero(mask)
+        index = np.full(field.shape, -1, dtype=np.int64)
+        index.flat[cells] = np.arange(cells.size)
+        right = mask[:, :-1] & mask[:, 1:]
+        down = mask[:-1, :] & mask[1:, :]
+        rows = np.concatenate([index[:, :-1][right], index[:-1, :][down]])
+        cols = np.concatenate([index[:, 1:][right], index[1:, :][down]])
+        adjacency = sparse.coo_matrix(
+            (np.ones(2 * rows.size), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+            shape=(cells.size, cells.size)).tocsr()
+        degree = np.asarray(adjacency.sum(axis=1)).ravel()
+        return (sparse.diags(degree) - adjacency).tocsr(), cells
+
+    @classmethod
+    def shape_residual(cls, current: ndarray, previous: ndarray) -> float:
+        """
+        2つの状態をそれぞれ最大絶対値で正規化したときの差の最大値を返します。
+        拡散によって全体が減衰していく場合でも、分布の形が変化しなくなれば0に近づきます。
+
+        引数:
+            current (ndarray): 現在の状態
+            previous (ndarray): 比較する以前の状態
+
+        戻り値:
+            float: 残差
+        """
+        current_scale = np.max(np.abs(current))
+        previous_scale = np.max(np.abs(previous))
+        if current_scale == 0 or previous_scale == 0:
+            return float(current_scale != previous_scale)
+        return float(np.max(np.abs(current / current_scale - previous / previous_scale)))
+
+    @classmethod
+    def diffuse_sparse(cls, field: ndarray, R: ndarray, rate: float, steps: int, substeps: int = 100, linear_solver: Literal['direct', 'cg'] = 'direct', history: FrameHistory | None = None, tol: float | None = None, progress: bool = True):
+        """
+        graph_laplacian の行列 L を用いて、熱拡散 dR/dt = -rate * L R を後退オイラー法で substeps 回に分けて時間発展させます。
+
+        引数:
+            field (ndarray): 迷路のフィールド
+            R (ndarray): 初期値
+            rate (float): 拡散係数（difficulty の alpha * dt / dx^2 に相当）
+            steps (int): 解く時間の長さ（difficulty の反復回数に相当）
+            substeps (int): 時間ステップ数（デフォルト: 100）
+            linear_solver (Literal['direct', 'cg']): 'direct' は LU 分解を1度だけ行って使い回し、
+                'cg' は対角スケーリングを前処理とする共役勾配法で解きます（デフォルト: 'direct'）。
+                'cg' が収束しなかった場合は np.linalg.LinAlgError を送出します
+            history (FrameHistory | None): 各時間ステップの開始時の値の記録方法（デフォルト: 全ステップを記録）
+            tol (float | None): 時間ステップごとの残差を時間1あたりに換算した値がtol以下になったら終了します（オプション）
+            progress (bool): 進捗を表示するかどうか（SHOW_PROGRESS が False の場合は表示しません、デフォルト: True）
+
+        戻り値:
+            tuple: (最終的な値, 各時間ステップの開始時の値の履歴)
+            履歴の iterations には行った時間ステップ数、residual には最後の残差を保持します。
+        """
+        assert linear_solver in ['direct', 'cg']
+        L, cells = cls.graph_laplacian(field)
+        # R と同じ精度で解く（float32 の場合は LU 分解と反復も単精度になる）
+        dtype = R.dtype if np.issubdtype(R.dtype, np.floating) else np.float64
+        result = np.zeros(field.shape, dtype=dtype)
+        hist = FrameHistory() if history is None else history
+        hist.begin(substeps, field.shape, result.dtype)
+        if cells.size == 0:
+            return result, hist
+        r = R.ravel()[cells].astype(dtype)
+        A = (sparse.identity(cells.size) + rate * steps / substeps * L).astype(dtype).tocsc()
+        if linear_solver == 'direct':
+            solve = splinalg.splu(A).solve
+        else:
+            preconditioner = sparse.diags(1.0 / A.diagonal())
+            rtol = max(1e-8, 10 * np.finfo(dtype).eps)
+
+            def solve(b):
+                x, info = splinalg.cg(A, b, x0=b, M=preconditioner, rtol=rtol)
+                if info != 0:
+                    raise np.linalg.LinAlgError(f"共役勾配法が収束しませんでした（info={info}）")
+                return x
+        for step in tqdm(range(substeps), desc="Difficulty Implicit Diffusion in Progress", ncols=100, disable=not (SHOW_PROGRESS and progress)):
+            result.flat[cells] = r
+            hist.record(step, result)
+            previous, r = r, solve(r)
+            hist.iterations = step + 1
+            hist.residual = cls.shape_residual(r, previous) * substeps / steps
+            if tol is not None and hist.residual <= tol:
+                break
+        result.flat[cells] = r
+        return result, hist
+
+    @classmethod
+    def difficulty(cls, field: np.ndarray, alpha: float = 0.5, steps: int = 1000, neighbor_score: np.ndarray | None = None, delta_score: np.ndarray | None = None, target_labels:ndarray|None=None, labels: ndarray|None=None, solver: Literal['explicit', 'implicit'] = 'explicit', history: FrameHistory | None = None, tol: float | None = None, check_every: int = 100, dtype: np.dtype | None = None, neighbor_count: ndarray | None = None, progress: bool = True, **solver_options):
         """
         迷路の難易度を計算します。熱拡散方程式を用いてスコアを伝播させます。
 
         引数:
-            field (np.ndarray): 迷路のフィールド
+            field (np.ndarray): 迷路のフィールド。(N, 高さ, 幅) のように同じ大きさのフィールドを重ねた場合は、
+                すべてのフィールドを1つのループでまとめて計算します（'explicit' のみ）
             alpha (float): 拡散係数（デフォルト: 0.5）
             steps (int): シミュレーションのステップ数（デフォルト: 1000）
             neighbor_score (np.ndarray | None): 事前計算された隣接スコア（オプション）
             delta_score (np.ndarray | None): 事前計算されたデルタスコア（オプション）
-            target_labels (ndarray|None): 対象となるラベル（オプション）
+            target_labels (ndarray|None): 対象となるラベル（オプション）。重ねたフィールドではフィールドごとのラベルの並び
             labels (ndarray|None): 各セルのラベル（オプション）
+            solver (Literal['explicit', 'implicit']): 'explicit' は陽解法で steps 回反復します（基準となる実装）。
+                'implicit' は疎行列で解きます（diffuse_sparse を参照）
+            history (FrameHistory | None): 難易度スコアの履歴の記録方法（デフォルト: 全ステップを記録）
+            tol (float | None): check_every ステップごとに1ステップの残差（shape_residual）を確認し、tol以下であれば終了します（オプション）
+            check_every (int): 残差を確認する間隔（デフォルト: 100）
+            dtype (np.dtype | None): 拡散の計算に使うデータ型（デフォルト: デルタスコアと同じ float64）。
+                np.float32 を指定すると反復で読み書きするメモリの量が半分になります。
+                float64 との差は、最大絶対値に対する比で 2e-5 程度以下です（DungeonMakerBench.py の compute_dtype を参照）
+            neighbor_count (ndarray | None): 事前計算された隣接するオープンセルの数（オプション）
+            progress (bool): 進捗を表示するかどうか（SHOW_PROGRESS が False の場合は表示しません、デフォルト: True）
+            **solver_options: diffuse_sparse に渡す引数（substeps, linear_solver）
 
         戻り値:
             tuple: (最終的な難易度スコア, 難易度スコアの履歴)
+            履歴の iterations には行ったステップ数、residual には最後に確認した残差を保持します。
         """
+        assert solver in ('explicit', 'implicit')
         if delta_score is None:
             delta_score = cls.delta_score(field, neighbor_score)
 
-        neighbor_count = cls.neighbor_count(field)
+        if neighbor_count is None:
+            neighbor_count = cls.neighbor_count(field)
 
-        def norm(selector):
-            delta_score[selector] = Constant.RN2C(delta_score[selector])
+        def norm(crop, selector):
+            area = delta_score[crop]
+            area[selector] = Constant.RN2C(area[selector])
 
         if not (target_labels is None or labels is None):
-            cls.apply_each_areas(target_labels,labels, lambda selector,lbl: norm(selector))
+            if field.ndim == 2:
+                cls.apply_each_crops(target_labels, labels, lambda crop, selector, lbl: norm(crop, selector))
+            else:
+                # 重ねたフィールドでは target_labels をフィールドごとのラベルの並びとして扱う
+                for i in range(field.shape[0]):
+                    cls.apply_each_crops(target_labels[i], labels[i], lambda crop, selector, lbl: norm((i, *crop), selector))
 
         dx = dy = 1.0
         dt = 1.0
         ddx = ddy = 1.0 / dx**2
         alpha = min(alpha, (0.5 / (ddx + ddy)) / dt)
 
-        R = delta_score.copy()
+        R = delta_score.astype(delta_score.dtype if dtype is None else dtype)
         mask = field == 0
 
-        # カーネルを作成
-        kernel = np.array([
-            [0, ddy, 0],
-            [ddx, 0, ddx],
-            [0, ddy, 0]]
-        )
-
-        kernel = alpha * dt * kernel
-        neighbor_count = alpha * dt * neighbor_count * ddx
-
-        hist = []
-        for _ in tqdm(range(steps), desc="Difficulty Heat Diffusion in Progress", ncols=100):
-            hist.append(R.copy())
-
-            # 畳み込み演算
-            laplacian = np.pad(R, 1, mode='constant', constant_values=0)
-            laplacian = signal.convolve2d(laplacian, kernel, mode='valid')
-
-            # 更新
-            R[mask] += laplacian[mask] - neighbor_count[mask]*R[mask]
-            R[~mask] = 0
-
-        return R, hist
+        if solver != 'explicit':
+            assert field.ndim == 2, "疎行列のソルバは重ねたフィールドに対応していません"
+            return cls.diffuse_sparse(field, R, alpha * dt * ddx, steps, history=history, tol=tol, progress=progress, **solver_options)
+
+        # 近傍の重み（dx == dy なので上下左右で共通）
+        weight = alpha * dt * ddx
+
+        # 値はパディング配列に保持し、反復では連続な帯の上だけで計算する
+        stencil = NeighborStencil(R.shape, R.dtype)
+        padded = stencil.pad(R)
+        R = stencil.interior(padded)
+        band = stencil.band(padded)
+        neighbor_count = stencil.band(stencil.pad(alpha * dt * neighbor_count * ddx * mask, R.dtype))
+        open_cells = stencil.band(stencil.pad(mask, R.dtype))
+        update = np.empty_like(band)
+        previous = np.empty_like(R)
+
+        hist = FrameHistory() if history is None else history
+        hist.begin(steps, R.shape, R.dtype)
+        for step in tqdm(range(steps), desc="Difficulty Heat Diffusion in Progress", ncols=100, disable=not (SHOW_PROGRESS and progress)):
+            hist.record(step, R)
+            check = (step + 1) % check_every == 0 or step == steps - 1
+            if check:
+                np.copyto(previous, R)
+
+            # 重みを掛けた近傍の和（フィールドの外側は0）
+            np.multiply(band, weight, out=stencil.source_band)
+            laplacian = stencil.neighbor_sum()
+
+            # 更新（壁と余白のセルは0に戻す）
+            np.multiply(neighbor_count, band, out=update)
+            np.subtract(laplacian, update, out=update)
+            np.add(band, update, out=band)
+            np.multiply(band, open_cells, out=band)
+
+            hist.iterations = step + 1
+            if check:
+                hist.residual = cls.shape_residual(R, previous)
+                if tol is not None and hist.residual <= tol:
+                    break
+
+        return R.copy(), hist
     
     @classmethod
     def difficulty_peaks(cls, field: ndarray, difficulty_score: ndarray | None = None, target_labels: ndarray | None = None, labels: ndarray | None = None,** kwargs):
@@ -661,33 +1831,35 @@ class Analyzer:
             difficulty_score, field == 0, 'maximum')
         min_peaks = Constant.get_peak2D(
             difficulty_score, field == 0, 'minimum')
-        normalized_peak_value = np.zeros_like(field)
+        normalized_peak_value = np.zeros(field.shape, dtype=difficulty_score.dtype)
         
-        def norm(selector):
-            max_selector = selector & max_peaks
-            min_selector = selector & min_peaks
+        def norm(crop, selector):
+            score = difficulty_score[crop]
+            peak_value = normalized_peak_value[crop]
+            max_selector = selector & max_peaks[crop]
+            min_selector = selector & min_peaks[crop]
             if max_selector.any():
-                normalized_peak_value[max_selector] = Constant.min_max_normalize(
-                    difficulty_score[max_selector]
+                peak_value[max_selector] = Constant.min_max_normalize(
+                    score[max_selector]
                 ) + 1
             else:
                 max_selector = selector & (
-                    difficulty_score == np.max(difficulty_score[selector]))
-                normalized_peak_value[max_selector] = 2
+                    score == np.max(score[selector]))
+                peak_value[max_selector] = 2
             if min_selector.any():
-                normalized_peak_value[min_selector] = -(Constant.min_max_normalize(
-                    -difficulty_score[min_selector]
+                peak_value[min_selector] = -(Constant.min_max_normalize(
+                    -score[min_selector]
                 ) + 1)
             else:
                 min_selector = selector & (
-                    difficulty_score == np.min(difficulty_score[selector]))
-                normalized_peak_value[min_selector] = -2
+                    score == np.min(score[selector]))
+                peak_value[min_selector] = -2
         
         if target_labels is None or labels is None:
-            norm(field == 0)
+            norm(np.s_[:, :], field == 0)
         else:
-            cls.apply_each_areas(target_labels, labels,
-                                 lambda selector, lbl: norm(selector))
+            cls.apply_each_crops(target_labels, labels,
+                                 lambda crop, selector, lbl: norm(crop, selector))
         
         return max_peaks, min_peaks, normalized_peak_value
     
@@ -704,65 +1876,183 @@ class Analyzer:
         for lbl in target_labels:
             apply_func(labels==lbl,lbl)
 
+    @classmethod
+    def area_slices(cls, target_labels: ndarray, labels: ndarray) -> list[tuple[int, tuple[slice, slice]]]:
+        """
+        各エリアの外接矩形を求めます。scipy.ndimage.find_objects でラベル配列を1回だけ走査します。
+
+        引数:
+            target_labels (ndarray): 対象となるラベル
+            labels (ndarray): 各セルのラベル
+
+        戻り値:
+            list[tuple[int, tuple[slice, slice]]]: (ラベル, 外接矩形のスライス) のリスト。
+            labels に含まれないラベルは除きます。
+        """
+        objects = ndimage.find_objects(labels)
+        slices = []
+        for lbl in target_labels:
+            lbl = int(lbl)
+            if lbl <= 0:
+                # find_objects は0以下のラベルを背景として扱うため、フィールド全体を対象にする
+                slices.append((lbl, np.s_[:, :]))
+            elif lbl <= len(objects) and objects[lbl - 1] is not None:
+                slices.append((lbl, objects[lbl - 1]))
+        return slices
+
+    @classmethod
+    def apply_each_crops(cls, target_labels: ndarray, labels: ndarray, apply_func: Callable[[tuple[slice, slice], ndarray, int], None]):
+        """
+        指定された関数を各エリアの外接矩形の上で適用します。
+        apply_each_areas と異なりフィールド全体のマスクを作らないため、
+        計算量はエリアの数ではなく外接矩形の面積の合計に比例します。
+
+        引数:
+            target_labels (ndarray): 対象となるラベル
+            labels (ndarray): 各セルのラベル
+            apply_func (Callable[[tuple[slice, slice], ndarray, int], None]): (外接矩形のスライス, 矩形内のエリアのマスク, ラベル) を受け取る関数
+
+        使用例:
+            def fill(crop, selector, lbl):
+                result[crop][selector] = lbl
+            Analyzer.apply_each_crops(route_labels, labels, fill)
+        """
+        for lbl, crop in cls.area_slices(target_labels, labels):
+            apply_func(crop, labels[crop] == lbl, lbl)
+
     @classmethod
     def fluid(cls, sources: np.ndarray, stable: np.ndarray, mask: np.ndarray, steps: int,
-              fmax: float, fmin: float, alpha: float = 0.5):
+              fmax: float, fmin: float, alpha: float = 0.5, history: FrameHistory | None = None,
+              tol: float | None = None, check_every: int = 100, thres_fill: float | None = None, normalize: bool = True,
+              dtype: np.dtype | None = None, progress: bool = True):
         """
         流体シミュレーションを行い、スコアの伝播を計算します。
 
         引数:
-            sources (np.ndarray): 初期ソース値
+            sources (np.ndarray): 初期ソース値。(N, 高さ, 幅) のように同じ大きさのフィールドを重ねた場合は、
+                すべてのフィールドを1つのループでまとめて計算し、到達の閾値と到達ステップの正規化はフィールドごとに行います
             stable (np.ndarray): 安定度（各セルの値の変化しにくさ）
             mask (np.ndarray): シミュレーション対象のマスク
             steps (int): シミュレーションのステップ数
             fmax (float): 最大値
             fmin (float): 最小値
             alpha (float): 拡散係数（デフォルト: 0.5）
+            history (FrameHistory | None): 流体値の履歴の記録方法（デフォルト: 全ステップを記録）
+            tol (float | None): check_every ステップごとに1ステップの残差（shape_residual）を確認し、tol以下であれば
+                全てのセルに到達していなくても終了します（オプション）
+            check_every (int): 残差を確認する間隔（デフォルト: 100）
+            thres_fill (float | None): 到達とみなす流体値の閾値（デフォルト: sources の平均の0.2倍と最小値の0.8倍の和）。
+                重ねたフィールドではフィールドごとの閾値の配列も指定できます
+            normalize (bool): False の場合は到達ステップを正規化せず、到達しなかったセルを -1 のまま返します（デフォルト: True）
+            dtype (np.dtype | None): 流体の計算に使うデータ型（デフォルト: sources と同じ）。
+                np.float32 の場合は、流体値が閾値の近くで止まるセルの到達ステップが変わります（数%のセル）。
+                到達が最も遅いセルも変わりやすいため、set_start_goal のゴールが変わることがあります（DungeonMakerBench.py の compute_dtype を参照）
+            progress (bool): 進捗を表示するかどうか（SHOW_PROGRESS が False の場合は表示しません、デフォルト: True）
 
         戻り値:
             tuple: (最終的な流体値, 流体値の履歴, 正規化された到達ステップ)
+            履歴の iterations には行ったステップ数、residual には最後に確認した残差を保持します。
         """
         alpha = min(alpha, 1.0)
+        if dtype is not None:
+            sources = sources.astype(dtype, copy=False)
         if mask is None:
             mask = np.ones_like(sources, dtype=bool)
-        # 有効なセルの数を計算
-        count_table = np.sum(np.stack([np.roll(mask, (i, j), (0, 1)) for i, j in [
-                            (0, 1), (0, -1), (1, 0), (-1, 0)]]), axis=0) * mask
+        stencil = NeighborStencil(sources.shape, sources.dtype)
+        # 有効なセルの数を計算（フィールドの端は折り返さない）
+        count_table = stencil.unband(stencil.neighbor_sum(mask)) * mask
 
         # 更新が必要なセルを特定
         updateds_checker = (stable != 0) & (count_table > 0)
 
-        fluid_hist = []
-        fluid_current = sources.copy()
-        thres_fill = (np.mean(sources)*0.2 + np.min(sources)*0.8)
-        filled_steps = np.full_like(sources,-1)
-
-        for step in tqdm(range(steps), desc="Difficulty Fluid Diffusion in Progress", ncols=100):
-            fluid_hist.append(fluid_current.copy())
-            filled_steps[(filled_steps == -1) &
-                         (fluid_hist[-1] > thres_fill)] = step
-            if not ((filled_steps == -1) & mask).any():
+        # 反復の中で変わらない係数を事前に計算し、パディング配列の帯として保持する
+        stable_mask = stencil.band(stencil.pad(stable * mask, sources.dtype))
+        inflow = stencil.band(stencil.pad(alpha / (count_table + 1) * updateds_checker, sources.dtype))
+        outflow = stencil.band(stencil.pad(alpha * stable * (count_table / (count_table + 1)) * updateds_checker, sources.dtype))
+        mask_band = stencil.band(stencil.pad(mask, bool))
+
+        fluid_hist = FrameHistory() if history is None else history
+        fluid_hist.begin(steps, sources.shape, sources.dtype)
+        current_padded = stencil.pad(sources)
+        fluid_current = stencil.interior(current_padded)
+        current = stencil.band(current_padded)
+        previous = np.empty_like(current)
+        change = np.empty_like(current)
+        if thres_fill is None and sources.ndim == 2:
+            thres_fill = (np.mean(sources)*0.2 + np.min(sources)*0.8)
+        elif thres_fill is None:
+            thres_fill = np.array([np.mean(s)*0.2 + np.min(s)*0.8 for s in sources])
+        if np.ndim(thres_fill) > 0:
+            # フィールドごとの閾値を帯の形に広げる
+            thres_fill = stencil.band(stencil.pad(np.broadcast_to(np.reshape(thres_fill, (-1, 1, 1)), sources.shape)))
+        filled_padded = stencil.pad(np.full_like(sources,-1))
+        filled = stencil.band(filled_padded)
+        unfilled = np.empty(current.shape, dtype=bool)
+        crossed = np.empty(current.shape, dtype=bool)
+
+        for step in tqdm(range(steps), desc="Difficulty Fluid Diffusion in Progress", ncols=100, disable=not (SHOW_PROGRESS and progress)):
+            fluid_hist.record(step, fluid_current)
+            np.copyto(previous, current)
+            np.equal(filled, -1, out=unfilled)
+            np.greater(previous, thres_fill, out=crossed)
+            crossed &= unfilled
+            np.copyto(filled, step, where=crossed)
+            unfilled ^= crossed
+            unfilled &= mask_band
+            if not unfilled.any():
                 break
+            if sources.ndim > 2 and crossed.any():
+                # 到達し終えたフィールドは、単独で計算した場合と同じように値の更新を止める
+                running = stencil.unband(unfilled).any(axis=(-2, -1))
+                stencil.unband(inflow)[~running] = 0
+                stencil.unband(outflow)[~running] = 0
 
 
             # 近傍セルの値の合計を計算
-            neighbor_sum = np.sum(np.stack([np.roll(fluid_hist[-1] * stable * mask, (i, j), (0, 1))
-                                for i, j in [(0, 1), (0, -1), (1, 0), (-1, 0)]]), axis=0)
+            np.multiply(previous, stable_mask, out=stencil.source_band)
+            neighbor_sum = stencil.neighbor_sum()
 
             # D_copyを更新
-            fluid_current += alpha * neighbor_sum / (count_table + 1) * updateds_checker
-            fluid_current -= alpha * fluid_hist[-1] * stable * \
-                (count_table / (count_table + 1)) * updateds_checker
+            np.multiply(neighbor_sum, inflow, out=change)
+            current += change
+            np.multiply(previous, outflow, out=change)
+            current -= change
 
             # 値の範囲を制限
-            np.clip(fluid_current, fmin, fmax, out=fluid_current)
+            np.clip(current, fmin, fmax, out=current)
 
-        filled_steps[(filled_steps == -1) & mask] = np.max(filled_steps) + 1
+            fluid_hist.iterations = step + 1
+            if (step + 1) % check_every == 0 or step == steps - 1:
+                fluid_hist.residual = cls.shape_residual(fluid_current, stencil.unband(previous))
+                if tol is not None and fluid_hist.residual <= tol:
+                    break
 
-        return fluid_current, fluid_hist, filled_steps/np.max(filled_steps)
+        fluid_current = fluid_current.copy()
+        filled_steps = stencil.interior(filled_padded).copy()
+        if normalize and filled_steps.ndim == 2:
+            filled_steps = cls.normalize_filled_steps(filled_steps, mask)
+        elif normalize:
+            filled_steps = np.stack([cls.normalize_filled_steps(field_steps, field_mask) for field_steps, field_mask in zip(filled_steps, mask)])
+
+        return fluid_current, fluid_hist, filled_steps
+
+    @classmethod
+    def normalize_filled_steps(cls, filled_steps: ndarray, mask: ndarray):
+        """
+        到達ステップを最大値で割って正規化します。到達しなかったセル（-1）は最大の到達ステップ + 1 とします。
+
+        引数:
+            filled_steps (ndarray): 各セルの到達ステップ（到達しなかったセルは -1）。この配列を書き換えます
+            mask (ndarray): 対象のマスク
+
+        戻り値:
+            ndarray: 正規化された到達ステップ
+        """
+        filled_steps[(filled_steps == -1) & mask] = np.max(filled_steps) + 1
+        return filled_steps / max(np.max(filled_steps), 1)
     
     @classmethod
-    def fluid_difficulty(cls, field: ndarray, source_amount: float = 3.0, steps: int = 1000, normalized_peak_value: ndarray | None = None, delta_score: ndarray | None = None, target_labels: ndarray | None = None, labels: ndarray | None = None, ** kwargs):
+    def fluid_difficulty(cls, field: ndarray, source_amount: float = 3.0, steps: int = 1000, normalized_peak_value: ndarray | None = None, delta_score: ndarray | None = None, target_labels: ndarray | None = None, labels: ndarray | None = None, history: FrameHistory | None = None, tol: float | None = None, check_every: int = 100, dtype: np.dtype | None = None, ** kwargs):
         """
         流体シミュレーションを用いて難易度を計算します。
 
@@ -774,6 +2064,10 @@ class Analyzer:
             delta_score (ndarray | None): デルタスコア（オプション）
             target_labels (ndarray | None): 対象となるラベル（オプション）
             labels (ndarray | None): 各セルのラベル（オプション）
+            history (FrameHistory | None): 流体値の履歴の記録方法（デフォルト: 全ステップを記録）
+            tol (float | None): 収束判定の許容値（fluid を参照、オプション）
+            check_every (int): 残差を確認する間隔（デフォルト: 100）
+            dtype (np.dtype | None): 流体の計算に使うデータ型（fluid を参照、デフォルト: 正規化されたピーク値と同じ）
             **kwargs: その他のキーワード引数
 
         戻り値:
@@ -797,35 +2091,176 @@ class Analyzer:
                 labels=maze_labels
             )
 
-            # 結果の可視化
-            import matplotlib.pyplot as plt
-            plt.imshow(fluid_result, cmap='coolwarm')
-            plt.colorbar()
-            plt.title('Fluid Difficulty')
-            plt.show()
+            # 結果の可視化
+            import matplotlib.pyplot as plt
+            plt.imshow(fluid_result, cmap='coolwarm')
+            plt.colorbar()
+            plt.title('Fluid Difficulty')
+            plt.show()
+        """
+        if normalized_peak_value is None:
+            normalized_peak_value = cls.difficulty_peaks(
+                field, target_labels=target_labels, labels=labels, **kwargs)[-1]
+        sources, stable = cls.fluid_sources(field, normalized_peak_value, source_amount, delta_score, target_labels, labels)
+        
+        return cls.fluid(sources, stable, field == 0, steps=steps, fmax=source_amount, fmin=-source_amount, history=history,
+                         tol=tol, check_every=check_every, dtype=dtype)
+    
+    @classmethod
+    def fluid_sources(cls, field: ndarray, normalized_peak_value: ndarray, source_amount: float = 3.0, delta_score: ndarray | None = None, target_labels: ndarray | None = None, labels: ndarray | None = None):
+        """
+        fluid_difficulty で流体シミュレーションに与えるソースと安定度を計算します。
+
+        引数:
+            field (ndarray): 迷路のフィールド
+            normalized_peak_value (ndarray): 正規化されたピーク値
+            source_amount (float): ソース量（デフォルト: 3.0）
+            delta_score (ndarray | None): デルタスコア（オプション）
+            target_labels (ndarray | None): 対象となるラベル（オプション）
+            labels (ndarray | None): 各セルのラベル（オプション）
+
+        戻り値:
+            tuple: (ソース, 安定度)
+        """
+        if delta_score is None:
+            delta_score = cls.delta_score(field)
+        stable = (Constant.min_max_normalize(delta_score) + 1) * 0.5
+        sources = np.zeros(field.shape, dtype=normalized_peak_value.dtype)
+
+        def d_norm(crop, selector):
+            peak_value = normalized_peak_value[crop]
+            max_peak = selector & (peak_value > 0)
+            stable[crop][selector] += peak_value[selector]*0.1
+            sources[crop][max_peak] = peak_value[max_peak]*0.5*source_amount
+
+        if target_labels is None or labels is None:
+            d_norm(np.s_[:, :], field == 0)
+        else:
+            cls.apply_each_crops(target_labels, labels,
+                                 lambda crop, selector, lbl: d_norm(crop, selector))
+        return sources, stable
+
+    @classmethod
+    def area_difficulty(cls, field: ndarray, steps: int, solver: Literal['explicit', 'implicit'] = 'explicit',
+                        dtype: np.dtype | None = None, target: bool = True):
+        """
+        1つのエリアだけを通路として残したフィールド（analyze_areas を参照）で、難易度とピーク値を計算します。
+        並列に呼ばれるため、進捗は表示しません。
+
+        引数:
+            field (ndarray): エリアの外接矩形を切り出し、エリア以外のセルを壁にしたフィールド
+            steps (int): シミュレーションのステップ数
+            solver (Literal['explicit', 'implicit']): difficulty のソルバ（デフォルト: 'explicit'）
+            dtype (np.dtype | None): 拡散の計算に使うデータ型（difficulty を参照）
+            target (bool): False の場合は対象外のエリアとして、スコアを中心化せずに拡散させ、ピーク値は0とします
+                （フィールド全体で計算した場合の対象外のエリアと同じ値、デフォルト: True）
+
+        戻り値:
+            tuple: (難易度スコア, 正規化されたピーク値)
+        """
+        labels = (field == 0).astype(np.int32)
+        target_labels = [1] if target else None
+        d_score, _ = cls.difficulty(field, steps=steps, target_labels=target_labels, labels=labels, solver=solver,
+                                    history=FrameHistory('none'), dtype=dtype, progress=False)
+        if not target:
+            return d_score, np.zeros_like(d_score)
+        _, _, normalized_peak_value = cls.difficulty_peaks(field, d_score, target_labels=target_labels, labels=labels)
+        return d_score, normalized_peak_value
+
+    @classmethod
+    def area_fill(cls, sources: ndarray, stable: ndarray, mask: ndarray, steps: int, source_amount: float, thres_fill: float):
+        """
+        1つのエリアの外接矩形で、正規化する前の到達ステップを計算します（analyze_areas を参照）。
+        並列に呼ばれるため、進捗は表示しません。
+
+        引数:
+            sources (ndarray): 外接矩形のソース
+            stable (ndarray): 外接矩形の安定度
+            mask (ndarray): 外接矩形の中のエリアのマスク
+            steps (int): シミュレーションのステップ数
+            source_amount (float): ソース量
+            thres_fill (float): フィールド全体のソースから求めた到達の閾値
+
+        戻り値:
+            ndarray: 到達ステップ（到達しなかったセルは -1）
         """
-        if delta_score is None:
-            delta_score = cls.delta_score(field)
-        if normalized_peak_value is None:
-            normalized_peak_value = cls.difficulty_peaks(
-                field, target_labels=target_labels, labels=labels, **kwargs)[-1]
-        stable = (Constant.min_max_normalize(delta_score) + 1) * 0.5
-        sources = np.zeros_like(field)
+        return cls.fluid(sources, stable, mask, steps=steps, fmax=source_amount, fmin=-source_amount,
+                         history=FrameHistory('none'), thres_fill=thres_fill, normalize=False, progress=False)[2]
+
+    @classmethod
+    def analyze_areas(cls, field: ndarray, target_labels: ndarray, labels: ndarray, steps: int = 1000, source_amount: float = 3.0,
+                      solver: Literal['explicit', 'implicit'] = 'explicit', workers: int | None = None, executor: Literal['thread', 'process'] = 'thread', dtype: np.dtype | None = None):
+        """
+        difficulty, difficulty_peaks, fluid_difficulty, set_start_goal を、エリアごとに外接矩形を切り出して並列に計算します。
+        エリアどうしは影響し合わないため、solver が 'explicit' の場合はフィールド全体で1度に計算した場合と同じ結果になります。
+        対象外のエリアも、フィールド全体で計算した場合と同じように難易度スコアだけを（中心化せずに）計算します。
+        'implicit' の場合は疎行列をエリアごとに分解するため、難易度スコアが丸め誤差の範囲で異なり、ピークの位置が変わることがあります。
+        フィールド全体に依存する値（安定度の正規化、到達の閾値、到達ステップの正規化）は、
+        難易度の計算とソースの計算の後にフィールド全体で求めてから各エリアに渡します。
 
-        def d_norm(selector):
-            max_peak = (normalized_peak_value > 0)
-            stable[selector] += normalized_peak_value[selector]*0.1
-            sources[selector & max_peak] = normalized_peak_value[selector &
-                                                                 max_peak]*0.5*source_amount
+        引数:
+            field (ndarray): 迷路のフィールド
+            target_labels (ndarray): 対象となるラベル
+            labels (ndarray): 各セルのラベル
+            steps (int): 難易度と流体のシミュレーションのステップ数（デフォルト: 1000）
+            source_amount (float): ソース量（デフォルト: 3.0）
+            solver (Literal['explicit', 'implicit']): difficulty のソルバ（デフォルト: 'explicit'）
+            workers (int | None): ワーカーの数（デフォルト: CPUコア数）。1の場合は並列化しません
+            executor (Literal['thread', 'process']): 'thread' はスレッドプール、'process' はプロセスプールで計算します（デフォルト: 'thread'）
+            dtype (np.dtype | None): 難易度と流体の計算に使うデータ型（difficulty を参照、デフォルト: float64）
 
-        if target_labels is None or labels is None:
-            d_norm(field == 0)
+        戻り値:
+            tuple: (難易度スコア, 正規化されたピーク値, 正規化された到達ステップ, スタートとゴールを示す配列, 各ラベルのスタートとゴールの位置)
+
+        使用例:
+            field, route_labels, labels = Constant().auto_setting(np.zeros((100, 100), dtype=np.uint8), 50, 3333, inplace=True)[-1]
+            d_score, normalized_peak_value, fluid_label, sg_result, sg_points = Analyzer.analyze_areas(
+                field, route_labels, labels, steps=5000, workers=4)
+        """
+        assert executor in ['thread', 'process']
+        areas = [(crop, labels[crop] == lbl) for lbl, crop in cls.area_slices(target_labels, labels)]
+        # 対象外のエリアは難易度スコアだけを求め、ソースを置かないため到達ステップは計算しない
+        other_labels = np.setdiff1d(np.unique(labels[field == 0]), target_labels)
+        other_areas = [(crop, labels[crop] == lbl) for lbl, crop in cls.area_slices(other_labels, labels)]
+        all_areas = areas + other_areas
+        if workers == 1:
+            pool = None
+            map_areas = map
+        elif executor == 'thread':
+            pool = ThreadPoolExecutor(max_workers=workers)
+            map_areas = pool.map
         else:
-            cls.apply_each_areas(target_labels, labels,
-                                 lambda selector, lbl: d_norm(selector))
-        
-        return cls.fluid(sources, stable, field == 0, steps=steps, fmax=source_amount, fmin=-source_amount)
-    
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=init_maze_worker)
+            map_areas = pool.map
+        try:
+            # エリア以外のセルを壁にして、エリアごとに難易度とピーク値を計算する
+            area_fields = [np.where(selector, field[crop], 1) for crop, selector in all_areas]
+            d_score = np.zeros(field.shape, dtype=np.float64 if dtype is None else dtype)
+            normalized_peak_value = np.zeros_like(d_score)
+            for (crop, selector), (area_score, area_peak_value) in zip(
+                    all_areas, map_areas(cls.area_difficulty, area_fields, [steps] * len(all_areas), [solver] * len(all_areas),
+                                         [dtype] * len(all_areas), [True] * len(areas) + [False] * len(other_areas))):
+                d_score[crop][selector] = area_score[selector]
+                normalized_peak_value[crop][selector] = area_peak_value[selector]
+
+            # ソースと到達の閾値はフィールド全体で求める
+            sources, stable = cls.fluid_sources(field, normalized_peak_value, source_amount,
+                                                target_labels=target_labels, labels=labels)
+            thres_fill = np.mean(sources)*0.2 + np.min(sources)*0.8
+            filled_steps = np.full(field.shape, -1, dtype=sources.dtype)
+            fills = map_areas(cls.area_fill, [sources[crop] for crop, _ in areas], [stable[crop] for crop, _ in areas],
+                              [selector for _, selector in areas], [steps] * len(areas), [source_amount] * len(areas),
+                              [thres_fill] * len(areas))
+            for (crop, selector), area_steps in zip(areas, fills):
+                filled_steps[crop][selector] = area_steps[selector]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        fluid_label = cls.normalize_filled_steps(filled_steps, field == 0)
+        sg_result, sg_points = cls.set_start_goal(field, fluid_label, normalized_peak_value, target_labels, labels)
+        return d_score, normalized_peak_value, fluid_label, sg_result, sg_points
+
     @classmethod
     def set_start_goal(cls, field: ndarray, filled_steps: ndarray, normalized_peak_value: ndarray, target_labels: ndarray | None = None, labels: ndarray | None = None):
         """
@@ -841,56 +2276,324 @@ class Analyzer:
         戻り値:
             tuple: (スタートとゴールを示す配列, 各ラベルのスタートとゴールの位置)
         """
-        result = np.zeros_like(field)
+        result = np.zeros(field.shape, dtype=np.int8)
         points = {}
         
-        def set_sg(selector, lbl):
-            max_point = (filled_steps == np.min(
-                filled_steps[selector])) & selector
-            max_point_values = (normalized_peak_value == np.max(
-                normalized_peak_value[max_point])) & max_point
-            min_point = (filled_steps == np.max(
-                filled_steps[selector])) & selector
-            min_point_values = min_point & (normalized_peak_value == np.min(normalized_peak_value[min_point]))
-            result[max_point_values] = 1
-            result[min_point_values] = -1
-            points[lbl] = [np.argwhere(min_point_values), np.argwhere(max_point_values)]
+        def set_sg(crop, selector, lbl):
+            steps = filled_steps[crop]
+            peak_value = normalized_peak_value[crop]
+            max_point = (steps == np.min(
+                steps[selector])) & selector
+            max_point_values = (peak_value == np.max(
+                peak_value[max_point])) & max_point
+            min_point = (steps == np.max(
+                steps[selector])) & selector
+            min_point_values = min_point & (peak_value == np.min(peak_value[min_point]))
+            result[crop][max_point_values] = 1
+            result[crop][min_point_values] = -1
+            # 外接矩形の中の位置をフィールド全体の位置に戻す
+            offset = [s.indices(n)[0] for s, n in zip(crop, field.shape)]
+            points[lbl] = [np.argwhere(min_point_values) + offset, np.argwhere(max_point_values) + offset]
         
         if target_labels is None or labels is None:
-            set_sg(field == 0, 0)
+            set_sg(np.s_[:, :], field == 0, 0)
         else:
-            cls.apply_each_areas(target_labels, labels,
-                                 lambda selector, lbl: set_sg(selector, lbl))
+            cls.apply_each_crops(target_labels, labels, set_sg)
         
         return result, points
     
     @classmethod
-    def create_maze(cls, shape:tuple[int,int], min_size:int):
+    def create_maze(cls, shape:tuple[int,int], min_size:int, seed:int|None=None, cache:MazeCache|None=None):
         """
         指定されたサイズと最小領域サイズで迷路を生成します。
 
         引数:
             shape (tuple[int,int]): 生成する迷路のサイズ（高さ, 幅）
             min_size (int): 最小の領域サイズ
+            seed (int|None): random と np.random に設定するシード（オプション）
+            cache (MazeCache|None): 迷路のキャッシュ（オプション）。seedを指定した場合のみ使用します
 
         戻り値:
             tuple: (迷路のフィールド, ラベル付けされた領域, スタートとゴールの候補位置)
         """
-        field = np.zeros(shape)
-        res = Constant().auto_setting(field, min_size, 300)
+        use_cache = cache is not None and seed is not None
+        if use_cache:
+            key = cache.make_key(shape=list(shape), min_size=min_size, seed=seed,
+                                 count=cls.MAZE_SETTING_COUNT, steps=cls.MAZE_DIFFUSION_STEPS,
+                                 solver=cls.MAZE_DIFFICULTY_SOLVER, tol=cls.MAZE_DIFFUSION_TOL,
+                                 dtype=np.dtype(cls.MAZE_COMPUTE_DTYPE).name)
+            maze = cache.load_maze(key)
+            if maze is not None:
+                return maze
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        field = np.zeros(shape, dtype=np.uint8)
+        res = Constant().auto_setting(field, min_size, cls.MAZE_SETTING_COUNT, inplace=True)
         result, route_labels, labels = res[-1]
 
         # Generate start and goal positions
-        d_score, _ = Analyzer.difficulty(
-            result, steps=5000, target_labels=route_labels, labels=labels)
-        _, _, normalized_peak_value = Analyzer.difficulty_peaks(
-            result, d_score, target_labels=route_labels, labels=labels)
-        _, _, fluid_label = Analyzer.fluid_difficulty(result, steps=5000, normalized_peak_value=normalized_peak_value,
-                                                      difficulty_score=d_score, target_labels=route_labels, labels=labels)
-        sg_result, sg_points = Analyzer.set_start_goal(field, fluid_label, normalized_peak_value,
-                                                       target_labels=route_labels, labels=labels)
+        analysis = MazeAnalysis(result, route_labels, labels, steps=cls.MAZE_DIFFUSION_STEPS, solver=cls.MAZE_DIFFICULTY_SOLVER,
+                                tol=cls.MAZE_DIFFUSION_TOL, dtype=cls.MAZE_COMPUTE_DTYPE,
+                                workers=cls.MAZE_ANALYSIS_WORKERS, executor=cls.MAZE_ANALYSIS_EXECUTOR)
+        sg_points = analysis.start_goal_points
+        if use_cache:
+            cache.save_maze(key, result, labels, sg_points, analysis.difficulty, analysis.filled_steps)
         return (result, labels, sg_points)
-            
+
+    @classmethod
+    def create_mazes(cls, shape:tuple[int,int], min_size:int, n:int, workers:int|None=None, seed:int|None=None) -> Iterator[tuple[int, int, tuple, float]]:
+        """
+        create_maze をプロセスプールで並列に実行し、n個の迷路を生成します。
+        各迷路には seed から派生させた独立なシードを割り当てるため、同じ seed からは同じ迷路の集合が得られます。
+
+        引数:
+            shape (tuple[int,int]): 生成する迷路のサイズ（高さ, 幅）
+            min_size (int): 最小の領域サイズ
+            n (int): 生成する迷路の数
+            workers (int|None): ワーカープロセスの数（デフォルト: CPUコア数）
+            seed (int|None): 全体のシード（オプション）
+
+        戻り値:
+            Iterator[tuple[int, int, tuple, float]]:
+            (迷路の番号, 迷路のシード, create_mazeの戻り値, 生成にかかった秒数) を生成が終わった順に返します。
+
+        使用例:
+            for index, maze_seed, (maze, labels, start_goal_candidates), elapsed in Analyzer.create_mazes((30, 30), 50, n=100, seed=0):
+                print(f"maze {index} (seed={maze_seed}): {elapsed:.2f}s")
+        """
+        seeds = [child.generate_state(1)[0].item() for child in np.random.SeedSequence(seed).spawn(n)]
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_maze_worker)
+        try:
+            futures = {executor.submit(timed_create_maze, shape, min_size, maze_seed): (index, maze_seed)
+                       for index, maze_seed in enumerate(seeds)}
+            for future in as_completed(futures):
+                index, maze_seed = futures[future]
+                maze, elapsed = future.result()
+                yield index, maze_seed, maze, elapsed
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+
+class MazeAnalysis:
+    """
+    1つの迷路のフィールドとラベルに対する Analyzer の解析結果を、必要になったときに計算して保持します。
+    neighbor_count から start_goal までの各プロパティは、最初に参照したときに依存する結果だけを計算し、
+    以降は保持した結果を返します。例えば difficulty と fluid は同じ neighbor_count と delta_score を共有します。
+
+    プロパティを参照するたびにフィールドを計算時の状態と比較し、変わっていれば保持した結果をすべて破棄します。
+    このとき、コンストラクタで渡したラベルも Constant.get_labels で振り直します。
+
+    使用例:
+            analysis = MazeAnalysis(field, route_labels, labels, steps=5000)
+            d_score = analysis.difficulty
+            start_goal_candidates = analysis.start_goal_points
+            field[3, 4] = 1
+            analysis.difficulty  # フィールドが変わったため再計算されます
+    """
+    def __init__(self, field: ndarray, route_labels: ndarray | None = None, labels: ndarray | None = None, steps: int = 1000,
+                 solver: Literal['explicit', 'implicit'] = 'explicit', tol: float | None = None,
+                 dtype: np.dtype | None = None, source_amount: float = 3.0,
+                 workers: int | None = 1, executor: Literal['thread', 'process'] = 'thread') -> None:
+        """
+        引数:
+            field (ndarray): 迷路のフィールド（0: 通路, 1: 壁）。配列はコピーせずに参照します
+            route_labels (ndarray | None): ルートのラベル（デフォルト: Constant.get_labels で求めます）
+            labels (ndarray | None): 各セルのラベル（デフォルト: Constant.get_labels で求めます）
+            steps (int): 難易度と流体のシミュレーションのステップ数（デフォルト: 1000）
+            solver (Literal['explicit', 'implicit']): difficulty のソルバ（デフォルト: 'explicit'）
+            tol (float | None): difficulty と fluid_difficulty の残差の許容値（オプション）
+            dtype (np.dtype | None): 難易度と流体の計算に使うデータ型（difficulty を参照）
+            source_amount (float): fluid_difficulty のソース量（デフォルト: 3.0）
+            workers (int | None): 1以外の場合は、difficulty から start_goal までを Analyzer.analyze_areas で
+                エリアごとに並列に計算します（デフォルト: 1）。tol を指定した場合は並列化しません
+            executor (Literal['thread', 'process']): analyze_areas の executor（デフォルト: 'thread'）
+        """
+        self.field = field
+        self.given_labels = None if route_labels is None or labels is None else (route_labels, labels)
+        self.steps = steps
+        self.solver = solver
+        self.tol = tol
+        self.dtype = dtype
+        self.source_amount = source_amount
+        self.workers = workers
+        self.executor = executor
+        self.snapshot = field.copy()
+        self.results: dict[str, object] = {}
+
+    def check_field(self):
+        """
+        フィールドが前回の確認から変わっていれば、保持した結果を破棄します。
+        """
+        if self.field.shape == self.snapshot.shape and np.array_equal(self.field, self.snapshot):
+            return
+        self.snapshot = self.field.copy()
+        self.given_labels = None
+        self.results.clear()
+
+    def cached(self, name: str, compute: Callable[[], object]):
+        """
+        nameの結果を保持していればそれを返し、なければ compute で計算して保持します。
+        """
+        self.check_field()
+        if name not in self.results:
+            self.results[name] = compute()
+        return self.results[name]
+
+    @property
+    def route_labels(self) -> ndarray:
+        return self.cached('labels', self.compute_labels)[0]
+
+    @property
+    def labels(self) -> ndarray:
+        return self.cached('labels', self.compute_labels)[1]
+
+    def compute_labels(self):
+        if self.given_labels is not None:
+            return self.given_labels
+        return Constant.get_labels(self.field)[:2]
+
+    @property
+    def neighbor_count(self) -> ndarray:
+        return self.cached('neighbor_count', lambda: Analyzer.neighbor_count(self.field))
+
+    @property
+    def delta_score(self) -> ndarray:
+        return self.cached('delta_score', lambda: Analyzer.delta_score(self.field, self.neighbor_count))
+
+    @property
+    def parallel(self) -> bool:
+        """
+        difficulty から start_goal までを analyze_areas でまとめて計算するかどうか
+        """
+        return self.workers != 1 and self.tol is None
+
+    @property
+    def difficulty(self) -> ndarray:
+        if self.parallel:
+            return self.cached('areas', self.compute_areas)[0]
+        return self.cached('difficulty', self.compute_difficulty)[0]
+
+    @property
+    def difficulty_history(self) -> FrameHistory | None:
+        """
+        difficulty の履歴（記録は行わず、iterations と residual だけを保持します）。並列に計算した場合は None
+        """
+        if self.parallel:
+            return None
+        return self.cached('difficulty', self.compute_difficulty)[1]
+
+    def compute_difficulty(self):
+        # difficulty は渡したデルタスコアをエリアごとに正規化して書き換えるため、コピーを渡す
+        return Analyzer.difficulty(self.field, steps=self.steps, delta_score=self.delta_score.copy(),
+                                   target_labels=self.route_labels, labels=self.labels, solver=self.solver,
+                                   history=FrameHistory('none'), tol=self.tol, dtype=self.dtype,
+                                   neighbor_count=self.neighbor_count)
+
+    @property
+    def peaks(self) -> tuple[ndarray, ndarray, ndarray]:
+        """
+        difficulty_peaks の戻り値 (極大値の位置, 極小値の位置, 正規化されたピーク値)
+        """
+        return self.cached('peaks', lambda: Analyzer.difficulty_peaks(
+            self.field, self.difficulty, target_labels=self.route_labels, labels=self.labels))
+
+    @property
+    def normalized_peak_value(self) -> ndarray:
+        if self.parallel:
+            return self.cached('areas', self.compute_areas)[1]
+        return self.peaks[2]
+
+    @property
+    def fluid(self) -> ndarray | None:
+        """
+        最終的な流体値。並列に計算した場合は None
+        """
+        if self.parallel:
+            return None
+        return self.cached('fluid', self.compute_fluid)[0]
+
+    @property
+    def fluid_history(self) -> FrameHistory | None:
+        if self.parallel:
+            return None
+        return self.cached('fluid', self.compute_fluid)[1]
+
+    @property
+    def filled_steps(self) -> ndarray:
+        """
+        正規化された到達ステップ
+        """
+        if self.parallel:
+            return self.cached('areas', self.compute_areas)[2]
+        return self.cached('fluid', self.compute_fluid)[2]
+
+    def compute_fluid(self):
+        return Analyzer.fluid_difficulty(self.field, source_amount=self.source_amount, steps=self.steps,
+                                         normalized_peak_value=self.normalized_peak_value, delta_score=self.delta_score,
+                                         target_labels=self.route_labels, labels=self.labels, history=FrameHistory('none'),
+                                         tol=self.tol, dtype=self.dtype)
+
+    @property
+    def start_goal(self) -> ndarray:
+        """
+        スタート（-1）とゴール（1）を示す配列
+        """
+        if self.parallel:
+            return self.cached('areas', self.compute_areas)[3]
+        return self.cached('start_goal', self.compute_start_goal)[0]
+
+    @property
+    def start_goal_points(self) -> dict[int, list[ndarray]]:
+        """
+        各ラベルのスタートとゴールの候補位置（create_maze の戻り値の3番目）
+        """
+        if self.parallel:
+            return self.cached('areas', self.compute_areas)[4]
+        return self.cached('start_goal', self.compute_start_goal)[1]
+
+    def compute_start_goal(self):
+        return Analyzer.set_start_goal(self.field, self.filled_steps, self.normalized_peak_value,
+                                       target_labels=self.route_labels, labels=self.labels)
+
+    def compute_areas(self):
+        return Analyzer.analyze_areas(self.field, self.route_labels, self.labels, steps=self.steps,
+                                      source_amount=self.source_amount, solver=self.solver,
+                                      workers=self.workers, executor=self.executor, dtype=self.dtype)
+
+
+def init_maze_worker():
+    """
+    迷路を並列生成するワーカープロセスを初期化します。
+    進捗表示と、プロセス数と競合する OpenCV 内部のスレッド並列を無効にします。
+    """
+    global SHOW_PROGRESS
+    SHOW_PROGRESS = False
+    cv2.setNumThreads(1)
+
+
+def generate_tile(shape:tuple[int,int], min_size:int, count:int, seed:int):
+    """
+    auto_setting_tiled の1つのタイルを生成します。
+
+    戻り値:
+        ndarray: 生成されたタイルのフィールド（uint8）
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    field = np.zeros(shape, dtype=np.uint8)
+    Constant().auto_setting(field, min_size, count, inplace=True)
+    return field
+
+
+def timed_create_maze(shape:tuple[int,int], min_size:int, seed:int):
+    """
+    create_maze を実行し、その戻り値と生成にかかった秒数を返します。
+    """
+    start = time.perf_counter()
+    maze = Analyzer.create_maze(shape, min_size, seed)
+    return maze, time.perf_counter() - start
+
 
 class Enemy:
     def __init__(self, pos: tuple[int, int], move_type: Literal['Random', 'TurnAlternation', 'LHandApproach', 'RHandApproach', 'StraightOccasionalRandom', None] = None) -> None:
@@ -970,6 +2673,296 @@ class Enemy:
                     self.direc = random.choice(self.direc_table)
 
 
+class MoveTable:
+    """
+    迷路の各マスから上下左右へ移動できるかを表すビットマスクと、各向きに壁（または迷路の端）までに通路が何マス続くかの表を保持します。
+    迷路を作成したときに1度だけ計算し、移動の判定やテレポートの距離の制限をマスごとの表の参照で行います。
+    隣り合う通路のマスを結んだグラフ（graph）も保持し、GoalField の幅優先探索に使用します。
+    向きの番号は MazeGame.step のアクションと同じです（0: 上, 1: 下, 2: 左, 3: 右）。
+
+    使用例:
+            moves = MoveTable(maze)
+            if moves.can_move((i, j), 3):
+                j += 1
+            max_distance = moves.wall_distance[0, i, j]  # 上に何マス進めるか
+    """
+    # 向き (di, dj)（0: 上, 1: 下, 2: 左, 3: 右）
+    DIRECTIONS = np.array([(-1, 0), (1, 0), (0, -1), (0, 1)])
+
+    def __init__(self, maze: ndarray) -> None:
+        """
+        引数:
+            maze (ndarray): 迷路の構造を表す2次元配列（0: 通路）
+        """
+        walkable = maze == 0
+        height, width = maze.shape
+        self.walkable = walkable
+        self.wall_distance = np.zeros((len(MoveTable.DIRECTIONS), height, width), dtype=np.int16)
+        up, down, left, right = self.wall_distance
+        for i in range(1, height):
+            up[i] = np.where(walkable[i - 1], up[i - 1] + 1, 0)
+        for i in range(height - 2, -1, -1):
+            down[i] = np.where(walkable[i + 1], down[i + 1] + 1, 0)
+        for j in range(1, width):
+            left[:, j] = np.where(walkable[:, j - 1], left[:, j - 1] + 1, 0)
+        for j in range(width - 2, -1, -1):
+            right[:, j] = np.where(walkable[:, j + 1], right[:, j + 1] + 1, 0)
+        # ビット k が立っていれば向き k の隣のマスが通路
+        self.passable = np.zeros(maze.shape, dtype=np.uint8)
+        for direction, distance in enumerate(self.wall_distance):
+            self.passable |= (distance > 0).astype(np.uint8) << direction
+        # 平坦化したマスの番号を頂点とし、通路のマスから下と右の通路のマスへの辺を張る（無向グラフとして使用）
+        index = np.arange(maze.size).reshape(maze.shape)
+        down_edge = walkable & (down > 0)
+        right_edge = walkable & (right > 0)
+        rows = np.concatenate([index[down_edge], index[right_edge]])
+        cols = np.concatenate([index[down_edge] + width, index[right_edge] + 1])
+        self.graph = sparse.csr_matrix((np.ones(rows.size), (rows, cols)), shape=(maze.size, maze.size))
+
+    def can_move(self, pos: ndarray | tuple[int, int], direction: ndarray | int) -> ndarray | bool:
+        """
+        位置 (i, j) から指定した向きの隣のマスに移動できるかどうかを返します。
+
+        引数:
+            pos (ndarray|tuple[int,int]): 位置 (i, j)、または位置の配列 (..., 2)
+            direction (ndarray|int): 向きの番号（0: 上, 1: 下, 2: 左, 3: 右）
+
+        戻り値:
+            ndarray|bool: 移動できる場合にTrue
+        """
+        pos = np.asarray(pos)
+        return (self.passable[pos[..., 0], pos[..., 1]] >> direction & 1).astype(bool)
+
+
+class GoalField:
+    """
+    ゴールから迷路全体へ1回の幅優先探索を行い、各マスのゴールまでの最短距離と、ゴールへ向かう次のマス（親）を保持します。
+    経路と最短距離は、探索をやり直さずに親を辿るか表を引くだけで求まります（経路の長さに比例する時間）。
+    ゴールに届かないマスの距離は inf です。
+
+    使用例:
+            field = GoalField(moves, goal)
+            distance = field.distance[i, j]
+            path = field.path((i, j), max_depth=10)
+    """
+    def __init__(self, moves: MoveTable, goal: tuple[int, int]) -> None:
+        """
+        引数:
+            moves (MoveTable): 迷路の移動の表
+            goal (tuple[int,int]): ゴールの位置 (i, j)
+        """
+        shape = moves.walkable.shape
+        self.shape = shape
+        self.goal = tuple(goal)
+        distance, parent = dijkstra(moves.graph, directed=False, indices=np.ravel_multi_index(self.goal, shape),
+                                    unweighted=True, return_predecessors=True)
+        self.distance = distance.reshape(shape)
+        # ゴールへ向かって次に進むマスの平坦化した番号（ゴールと届かないマスは負の値）
+        self.parent = parent.reshape(shape)
+
+    def path(self, start: tuple[int, int], max_depth: int | float = float('inf')) -> list[tuple[int, int]] | None:
+        """
+        start からゴールまでの最短経路を、start とゴールを含む位置 (i, j) のリストで返します。
+        経路が max_depth 個以上のマスを含む場合は、先頭の max_depth 個までに切り詰めます。
+
+        引数:
+            start (tuple[int,int]): 開始位置 (i, j)
+            max_depth (int|float): 経路に含めるマスの最大数（デフォルト: 制限なし）
+
+        戻り値:
+            list[tuple[int,int]]|None: 経路。ゴールに届かない場合はNone
+        """
+        if not np.isfinite(self.distance[start]):
+            return None
+        # 切り詰める場合は max_depth 個のマスを辿った時点で止める
+        length = int(self.distance[start]) + 1
+        steps = min(length, max_depth) if max_depth > 0 else length
+        width = self.shape[1]
+        node = start[0] * width + start[1]
+        path = []
+        for _ in range(int(steps)):
+            path.append(divmod(node, width))
+            node = self.parent.flat[node]
+        return path if length < max_depth else path[:max_depth]
+
+
+class EnemyGroup:
+    """
+    敵の位置・向き・移動タイプ・移動の蓄積量（stock）を配列で保持し、すべての敵を Enemy.next と同じ規則でまとめて進めます。
+    複数のゲームの敵を (ゲーム数, 敵の容量) の配列でまとめて扱え、各ゲームでは先頭の count 体が有効な敵です。
+    向きの変更は移動タイプごとの判定を配列でまとめて行い、左手・右手の回転は番号の表を、移動できるかは MoveTable を引いて求めます。
+    各マスにいる敵の数を occupancy に保持し、敵の追加と移動のたびに更新するため、衝突の判定は敵の数によらず配列を1回引くだけです。
+    pos を直接書き換えた場合は update_occupancy を呼んでください。
+    乱数には np.random.Generator を使うため、乱数列は Enemy と一致しませんが、移動の確率分布は同じです。
+
+    使用例:
+            enemies = EnemyGroup(maze)
+            enemies.add(0, np.argwhere(regions == region), 10)
+            enemies.next()
+            print(enemies.get_game_pos(0))
+    """
+    # 向きの番号は MoveTable と同じ（0: 上, 1: 下, 2: 左, 3: 右）
+    DIRECTIONS = MoveTable.DIRECTIONS
+    # Enemy.choice_direc の left_turn, right_turn を向きの番号で表した表
+    LEFT_TURN = np.array([2, 3, 1, 0])
+    RIGHT_TURN = np.array([3, 2, 0, 1])
+    MOVE_TYPES = ['Random', 'TurnAlternation', 'LHandApproach', 'RHandApproach', 'StraightOccasionalRandom']
+
+    def __init__(self, maze: ndarray, num_games: int = 1, rng: np.random.Generator | None = None, speed: float = 1,
+                 moves: MoveTable | None = None) -> None:
+        """
+        引数:
+            maze (ndarray): 迷路の構造を表す2次元配列
+            num_games (int): 敵を保持するゲームの数（デフォルト: 1）
+            rng (np.random.Generator|None): 乱数生成器（デフォルト: random から取り出したシードで作成）
+            speed (float): 1秒あたりに移動するマスの数（デフォルト: 1）
+            moves (MoveTable|None): 迷路の移動の表（デフォルト: maze から作成）
+        """
+        self.maze = maze
+        self.rng = rng if rng is not None else np.random.default_rng(random.getrandbits(64))
+        self.moves = moves if moves is not None else MoveTable(maze)
+        self.v = speed / MazeGame.FPS
+        self.count = np.zeros(num_games, dtype=int)
+        self.alive = np.zeros((num_games, 0), dtype=bool)
+        self.pos = np.zeros((num_games, 0, 2), dtype=int)
+        self.direc = np.zeros((num_games, 0), dtype=int)
+        self.move_type = np.zeros((num_games, 0), dtype=int)
+        self.stock = np.zeros((num_games, 0))
+        self.moved = np.zeros((num_games, 0), dtype=bool)
+        self.occupancy = np.zeros((num_games, *maze.shape), dtype=np.int16)
+
+    def __len__(self) -> int:
+        return int(self.count.sum())
+
+    def add(self, game: int, poses: ndarray, count: int, move_type: str | None = None):
+        """
+        ゲームに count 体の敵を追加します。位置は poses から、向きと移動タイプは一様に選びます。
+
+        引数:
+            game (int): ゲームの番号
+            poses (ndarray): 出現位置の候補 (i, j) の配列
+            count (int): 追加する敵の数
+            move_type (str|None): 移動タイプ（デフォルト: 一様に選ぶ）
+        """
+        if count <= 0:
+            return
+        start = self.count[game]
+        stop = start + count
+        if stop > self.stock.shape[1]:
+            # 容量を倍々に増やして、敵が増えるたびに配列を確保し直さないようにする
+            grow = max(stop, 2 * self.stock.shape[1]) - self.stock.shape[1]
+            self.alive = np.pad(self.alive, ((0, 0), (0, grow)))
+            self.pos = np.pad(self.pos, ((0, 0), (0, grow), (0, 0)))
+            self.direc = np.pad(self.direc, ((0, 0), (0, grow)))
+            self.move_type = np.pad(self.move_type, ((0, 0), (0, grow)))
+            self.stock = np.pad(self.stock, ((0, 0), (0, grow)))
+            self.moved = np.pad(self.moved, ((0, 0), (0, grow)))
+        self.pos[game, start:stop] = poses[self.rng.integers(len(poses), size=count)]
+        self.direc[game, start:stop] = self.rng.integers(len(EnemyGroup.DIRECTIONS), size=count)
+        if move_type is None:
+            self.move_type[game, start:stop] = self.rng.integers(len(EnemyGroup.MOVE_TYPES), size=count)
+        else:
+            self.move_type[game, start:stop] = EnemyGroup.MOVE_TYPES.index(move_type)
+        self.stock[game, start:stop] = 0.0
+        self.moved[game, start:stop] = False
+        self.alive[game, start:stop] = True
+        self.count[game] = stop
+        np.add.at(self.occupancy[game], tuple(self.pos[game, start:stop].T), 1)
+
+    def clear(self, game: int, count: int = 0):
+        """
+        ゲームの敵を先頭の count 体だけ残して取り除きます。
+
+        引数:
+            game (int): ゲームの番号
+            count (int): 残す敵の数（デフォルト: 0、すべて取り除く）
+        """
+        np.subtract.at(self.occupancy[game], tuple(self.pos[game, count:self.count[game]].T), 1)
+        self.count[game] = min(count, self.count[game])
+        self.alive[game, count:] = False
+        self.moved[game, count:] = False
+
+    def update_occupancy(self):
+        """
+        有効な敵の位置から occupancy を作り直します。
+        """
+        self.occupancy[...] = 0
+        games, slots = np.nonzero(self.alive)
+        np.add.at(self.occupancy, (games, *self.pos[games, slots].T), 1)
+
+    def choice_direc(self, pos: ndarray, direc: ndarray, move_type: ndarray) -> ndarray:
+        """
+        移動した敵の次の向きを、移動タイプごとに Enemy.choice_direc と同じ規則でまとめて選びます。
+
+        引数:
+            pos (ndarray): 敵の位置 (i, j) の配列 (M, 2)
+            direc (ndarray): 敵の現在の向きの番号 (M,)
+            move_type (ndarray): 敵の移動タイプの番号 (M,)
+
+        戻り値:
+            ndarray: 新しい向きの番号 (M,)
+        """
+        random_direc = self.rng.integers(len(EnemyGroup.DIRECTIONS), size=len(direc))
+        u = self.rng.random(len(direc))
+        ahead_valid = self.moves.can_move(pos, direc)
+        # TurnAlternation: Enemy.choice_direc は候補を変えても前のマスを判定するため、前が塞がっていれば一様に選び直す
+        keep_or_random = np.where(ahead_valid, direc, random_direc)
+
+        left = move_type == EnemyGroup.MOVE_TYPES.index('LHandApproach')
+        main_direc = np.where(left, EnemyGroup.LEFT_TURN[direc], EnemyGroup.RIGHT_TURN[direc])
+        sub_direc = np.where(left, EnemyGroup.RIGHT_TURN[direc], EnemyGroup.LEFT_TURN[direc])
+        main_valid = self.moves.can_move(pos, main_direc)
+        hand = np.where(main_valid, np.where(u < 0.2, random_direc, main_direc),
+                        np.where(ahead_valid, direc, sub_direc))
+
+        straight = np.where(u < 0.5, random_direc, keep_or_random)
+        return np.choose(move_type, [random_direc, keep_or_random, hand, hand, straight])
+
+    def next(self, running: ndarray | None = None):
+        """
+        すべての敵を Enemy.next と同じ規則で1フレーム進めます。
+
+        引数:
+            running (ndarray|None): 敵を進めるゲームを表すブール配列（デフォルト: すべてのゲーム）
+        """
+        alive = self.alive if running is None else self.alive & running[:, None]
+        self.stock[alive] += self.v
+        np.greater_equal(self.stock, 1, out=self.moved)
+        self.moved &= alive
+        if not self.moved.any():
+            return
+        games, slots = np.nonzero(self.moved)
+        self.stock[games, slots] = 0.0
+        pos = self.pos[games, slots]
+        direc = self.direc[games, slots]
+        next_pos = pos + EnemyGroup.DIRECTIONS[direc]
+        valid = self.moves.can_move(pos, direc)
+        np.subtract.at(self.occupancy, (games[valid], *pos[valid].T), 1)
+        np.add.at(self.occupancy, (games[valid], *next_pos[valid].T), 1)
+        pos = np.where(valid[:, None], next_pos, pos)
+        self.pos[games, slots] = pos
+        self.direc[games, slots] = self.choice_direc(pos, direc, self.move_type[games, slots])
+
+    def check_collision(self, games: ndarray, pos: ndarray) -> ndarray:
+        """
+        指定したゲームのそれぞれで、位置 pos に敵がいるかどうかを返します。
+
+        引数:
+            games (ndarray): ゲームの番号 (M,)
+            pos (ndarray): 調べる位置 (x, y) の配列 (M, 2)
+
+        戻り値:
+            ndarray: 敵がいる場合にTrueとなるブール配列 (M,)
+        """
+        return self.occupancy[games, pos[:, 1], pos[:, 0]] > 0
+
+    def get_game_pos(self, game: int) -> ndarray:
+        """
+        ゲームの有効な敵の位置を (x, y) の配列 (count, 2) で返します（Enemy.get_game_pos）。
+        """
+        return self.pos[game, :self.count[game], ::-1]
+
+
 class GameItem:
     def __init__(self, name: str, cooldown: int, duration: int, sound_name:str|None=None):
         self.name = name
@@ -1172,6 +3165,12 @@ class MazeGame:
     ITEM_FONTSIZE = 20
 
     ACTION_LOG_DIR = "log/"
+    # 迷路のキャッシュ（MAZE_SEEDを指定したときに使用します）
+    MAZE_CACHE_DIR = "cache/"
+    MAZE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    MAZE_SHAPE = [30, 30]
+    MAZE_MIN_SIZE = 50
+    MAZE_SEED = None
 
     def __init__(self, maze: ndarray, regions: ndarray, start_goal_candidates:dict[int,list[ndarray,ndarray]]) -> None:
         """
@@ -1185,6 +3184,23 @@ class MazeGame:
         self.maze = maze.copy()
         self.regions = regions
         self.start_goal_candidates = start_goal_candidates
+        self.light_stencil: NeighborStencil | None = None
+        self.moves = MoveTable(self.maze)
+        self.goal_field: GoalField | None = None
+        
+    @classmethod
+    def from_settings(cls):
+        """
+        MAZE_SHAPE, MAZE_MIN_SIZE, MAZE_SEED の設定から迷路を用意して MazeGame を作成します。
+        MAZE_SEED を指定した場合は MAZE_CACHE_DIR のキャッシュを使用するため、2回目以降は迷路の生成を省略できます。
+
+        戻り値:
+            MazeGame: 作成されたゲーム
+        """
+        cache = MazeCache(MazeGame.MAZE_CACHE_DIR, MazeGame.MAZE_CACHE_MAX_BYTES)
+        maze, labels, start_goal_candidates = Analyzer.create_maze(
+            tuple(MazeGame.MAZE_SHAPE), MazeGame.MAZE_MIN_SIZE, MazeGame.MAZE_SEED, cache)
+        return cls(maze, labels, start_goal_candidates)
         
     def reset(self, no_draw:bool=False):
         """
@@ -1213,7 +3229,7 @@ class MazeGame:
         self.mp_to_brightness_decaing = False
         self.player = PlayerStatus(MazeGame.MAX_MP, MazeGame.MAX_SIGHT, MazeGame.MAX_SIGHT)
         self.enemy_damage = self.player.max_sight/2
-        self.enemies: list[Enemy] = []
+        self.enemies = EnemyGroup(self.maze, moves=self.moves)
         self.action_log = []
         self.enemy_log = []
         import datetime
@@ -1278,13 +3294,10 @@ class MazeGame:
 
     def initialize_enemies(self, mask, enemy_count:int):
         # 敵の初期位置をランダムに選択（壁でない場所）
-        poses = np.argwhere(mask)
-        while len(self.enemies) < enemy_count:
-            self.enemies.append(Enemy(random.choice(poses)))
+        self.enemies.add(0, np.argwhere(mask), enemy_count - len(self.enemies))
     
     def initialize_enemy(self):
-        poses = np.argwhere(self.regions == self.region)
-        self.enemies.append(Enemy(random.choice(poses)))
+        self.enemies.add(0, np.argwhere(self.regions == self.region), 1)
 
     def log_action(self, action_type: str, details: dict = None):
         if self.start_time is None:
@@ -1301,9 +3314,7 @@ class MazeGame:
         if details:
             log_entry.update(details)
         self.action_log.append(log_entry)
-        check_maze = np.zeros_like(self.maze,dtype=int)
-        for enemy in self.enemies:
-            check_maze[enemy.pos] = 1
+        check_maze = (self.enemies.occupancy[0] > 0).astype(int)
         check_maze_str = f"{check_maze.tolist()}"
         self.enemy_log.append(f"{timestamp},{check_maze_str}")
 
@@ -1409,6 +3420,23 @@ class MazeGame:
         old_pos = self.player.pos
         self.player.move(new_pos)
         self.log_action("move", {"from": old_pos, "to": new_pos})
+
+    def move_direction(self, direction: int) -> bool:
+        """
+        プレイヤーを指定した向きに1マス移動させます。移動先が壁か迷路の外の場合は移動しません。
+
+        引数:
+            direction (int): 向きの番号（0: 上, 1: 下, 2: 左, 3: 右）
+
+        戻り値:
+            bool: 移動した場合はTrue
+        """
+        x, y = self.player.pos
+        if not self.moves.can_move((y, x), direction):
+            return False
+        di, dj = MoveTable.DIRECTIONS[direction]
+        self.move((x + dj.item(), y + di.item()))
+        return True
     
     def use_item(self, slot: int, no_draw: bool=False):
         """
@@ -1427,26 +3455,18 @@ class MazeGame:
         return False
 
     def update_enemy(self):
-        for enemy in self.enemies:
-            enemy.next(self.maze)
+        self.enemies.next()
 
     def check_collision(self, pos: tuple[int,int]|None=None):
         if pos is None:
             pos = self.player.pos
-        for enemy in self.enemies:
-            if pos == enemy.get_game_pos():
-                return True
-        return False
+        return bool(self.enemies.occupancy[0, pos[1], pos[0]] > 0)
 
     def teleport(self, direction, no_draw:bool = False):
         old_pos = self.player.pos
         x, y = self.player.pos
-        dx, dy = {
-            'UP': (0, -1),
-            'DOWN': (0, 1),
-            'LEFT': (-1, 0),
-            'RIGHT': (1, 0)
-        }[direction]
+        select = ['UP', 'DOWN', 'LEFT', 'RIGHT'].index(direction)
+        dy, dx = MoveTable.DIRECTIONS[select].tolist()
 
         max_distance = int(np.ceil(self.player.sight / MazeGame.TELEPORT_SIGHT_COST_PER_DISTANCE)) - 1
         if max_distance <= 1:
@@ -1460,14 +3480,8 @@ class MazeGame:
             if not no_draw:
                 self.play_sound('teleport')
 
-        for distance in range(1, max_distance + 1):
-            new_x, new_y = x + dx * distance, y + dy * distance
-            if (new_x < 0 or new_x >= self.maze.shape[1] or
-                new_y < 0 or new_y >= self.maze.shape[0] or
-                    self.maze[new_y, new_x] == 1):
-                # 壁にぶつかるか迷路の外に出る直前で停止
-                distance = distance - 1
-                break
+        # 壁にぶつかるか迷路の外に出る直前で停止
+        distance = min(max_distance, self.moves.wall_distance[select, y, x].item())
         to_pos = (x + dx * distance, y + dy * distance)
         while distance > 0 and self.check_collision(to_pos):
             distance -= 1
@@ -1620,18 +3634,21 @@ class MazeGame:
     
     def draw_enemy(self, visibility):
         all_look = self.player.get_vision_monster()
-        for enemy in self.enemies:
-            is_visible = self.is_visible_from_player(enemy.get_game_pos(), visibility)
+        enemies = self.enemies
+        for k in range(enemies.count[0]):
+            enemy_pos = tuple(enemies.pos[0, k])
+            game_pos = enemy_pos[::-1]
+            is_visible = self.is_visible_from_player(game_pos, visibility)
             if is_visible or all_look:
                 color = MazeGame.ENEMY_COLOR
                 if not all_look:
                     color = adjust_brightness(
-                        MazeGame.ENEMY_COLOR, visibility[*enemy.pos])
-                draw_monster_shape(self.screen, [(p+0.5)*MazeGame.CELL_SIZE for p in enemy.get_game_pos(
-                )], MazeGame.CELL_SIZE*1.3, min(max(0,enemy.stock),1.0), [-d for d in enemy.direc[::-1]], color)
+                        MazeGame.ENEMY_COLOR, visibility[enemy_pos])
+                draw_monster_shape(self.screen, [(p+0.5)*MazeGame.CELL_SIZE for p in game_pos
+                ], MazeGame.CELL_SIZE*1.3, min(max(0,enemies.stock[0, k]),1.0), [-d for d in EnemyGroup.DIRECTIONS[enemies.direc[0, k]][::-1]], color)
                 # pygame.draw.rect(self.screen, MazeGame.ENEMY_COLOR, enemy_rect)
-                if enemy.moved and is_visible:
-                    self.play_sound('monster_move', volume=visibility[*enemy.pos])
+                if enemies.moved[0, k] and is_visible:
+                    self.play_sound('monster_move', volume=visibility[enemy_pos])
     
     def draw_path_to_goal(self):
         path = self.shortest_path(self.player.pos, self.goal_pos, max_depth=int(self.player.sight)*2)
@@ -1801,28 +3818,28 @@ class MazeGame:
                 while ch.get_busy():
                     self.clock.tick(MazeGame.FPS)
     
-    def shortest_path(self, start, goal, max_depth):
-        rows, cols = self.maze.shape
-        start = (start[1], start[0])  # Convert to (y, x) format
-        goal = (goal[1], goal[0])  # Convert to (y, x) format
-        queue = deque([(start, [(start[1], start[0])])])
-        visited = set([start])
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # 右、下、左、上
+    def get_goal_field(self, goal: tuple[int, int] | None = None) -> GoalField:
+        """
+        ゴールからの距離の場（GoalField）を返します。同じゴールに対しては最初に作成した場を使い回します。
 
-        while queue:
-            (i, j), path = queue.popleft()
-            if (i, j) == goal:
-                if len(path) < max_depth:
-                    return path
-                return path[:max_depth]
+        引数:
+            goal (tuple, optional): ゴールの位置 (x, y)。省略時は現在のゴールの位置を使用。
 
-            for di, dj in directions:
-                ni, nj = i + di, j + dj
-                if 0 <= ni < rows and 0 <= nj < cols and self.maze[ni, nj] == 0 and (ni, nj) not in visited:
-                    queue.append(((ni, nj), path + [(nj, ni)]))
-                    visited.add((ni, nj))
+        戻り値:
+            GoalField: ゴールからの距離の場
+        """
+        if goal is None:
+            goal = self.goal_pos
+        goal = (goal[1], goal[0])  # Convert to (y, x) format
+        if self.goal_field is None or self.goal_field.goal != goal:
+            self.goal_field = GoalField(self.moves, goal)
+        return self.goal_field
 
-        return None  # 経路が見つからない場合
+    def shortest_path(self, start, goal, max_depth):
+        path = self.get_goal_field(goal).path((start[1], start[0]), max_depth)
+        if path is None:
+            return None  # 経路が見つからない場合
+        return [(j, i) for i, j in path]  # Convert to (x, y) format
     
     def gaussian_like_brightness(self,distance, max_distance):
         if distance > max_distance:
@@ -1872,23 +3889,28 @@ class MazeGame:
         戻り値:
             ndarray: 各セルの光の強度を表す2次元配列
         """
-        light = np.zeros_like(maze, dtype=float)
-        mask = maze == 0
+        if self.light_stencil is None or self.light_stencil.shape != maze.shape:
+            self.light_stencil = NeighborStencil(maze.shape)
+        stencil = self.light_stencil
+        light_padded = stencil.zeros()
+        light = stencil.interior(light_padded)
+        light_band = stencil.band(light_padded)
+        open_cells = stencil.band(stencil.pad(maze == 0, float))
         light[light_source] = max(0,intensity)
 
-        kernel = np.array([
-            [0, 0.5, 0],
-            [0.5, 1, 0.5],
-            [0, 0.5, 0]])
-        kernel /= np.sum(kernel)
+        # カーネル [[0, 0.5, 0], [0.5, 1, 0.5], [0, 0.5, 0]] を合計で割った重み
+        center_weight, neighbor_weight = 1 / 3, 0.5 / 3
 
         num_iterations = int(np.ceil(np.sqrt(abs(intensity))))
 
         for _ in range(num_iterations):
-            new_light = signal.convolve2d(light * mask, kernel, mode='same')
-            new_light[light_source] = intensity
-            new_light[~mask] = 0
-            light = new_light
+            np.multiply(light_band, open_cells, out=stencil.source_band)
+            neighbor_sum = stencil.neighbor_sum()
+            np.multiply(stencil.source_band, center_weight, out=light_band)
+            np.multiply(neighbor_sum, neighbor_weight, out=neighbor_sum)
+            light_band += neighbor_sum
+            light[light_source] = intensity
+            light_band *= open_cells
 
         return np.clip(light, 0, 1)
     
@@ -1951,14 +3973,12 @@ class MazeGame:
         if start is None:
             start = self.player.pos
 
-        # shortest_pathメソッドは (y, x) 形式を期待するので、座標を変換
-        path = self.shortest_path(start, self.goal_pos, max_depth=float('inf'))
+        distance = self.get_goal_field().distance[start[1], start[0]]
 
-        if path is None:
+        if not np.isfinite(distance):
             return float('inf')  # パスが見つからない場合
 
-        # パスの長さから1を引くと移動回数になる（開始位置を含むため）
-        return len(path) - 1
+        return int(distance)
             
     def setup(self, no_draw: bool=False):
         """
@@ -1975,6 +3995,7 @@ class MazeGame:
 
         self.player.pos = (player_pos[1].item(), player_pos[0].item())
         self.goal_pos = (goal_pos[1].item(), goal_pos[0].item())
+        self.get_goal_field()
 
         appear_mask = self.regions == self.region
         appear_mask[player_pos] = False
@@ -1997,15 +4018,9 @@ class MazeGame:
                         slot = event.key - pygame.K_1
                         self.use_item(slot)
                     elif not self.player.teleport_mode and self.player.extra_sight == 0:
-                        x, y = self.player.pos
-                        if event.key == pygame.K_UP and y > 0 and self.maze[y-1, x] == 0:
-                            self.move((x, y-1))
-                        elif event.key == pygame.K_DOWN and y < self.maze.shape[0]-1 and self.maze[y+1, x] == 0:
-                            self.move((x, y+1))
-                        elif event.key == pygame.K_LEFT and x > 0 and self.maze[y, x-1] == 0:
-                            self.move((x-1, y))
-                        elif event.key == pygame.K_RIGHT and x < self.maze.shape[1]-1 and self.maze[y, x+1] == 0:
-                            self.move((x+1, y))
+                        move_keys = [pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT]
+                        if event.key in move_keys:
+                            self.move_direction(move_keys.index(event.key))
                         elif event.key == pygame.K_SPACE:
                             self.handle_hint()
 
@@ -2096,15 +4111,8 @@ class MazeGame:
             slot = action - bright_action - 1
             self.use_item(slot, no_draw)
         elif not self.player.teleport_mode and self.player.extra_sight == 0 and not keep_press:
-            x, y = self.player.pos
-            if action == 0 and y > 0 and self.maze[y-1, x] == 0:
-                self.move((x, y-1))
-            elif action == 1 and y < self.maze.shape[0]-1 and self.maze[y+1, x] == 0:
-                self.move((x, y+1))
-            elif action == 2 and x > 0 and self.maze[y, x-1] == 0:
-                self.move((x-1, y))
-            elif action == 3 and x < self.maze.shape[1]-1 and self.maze[y, x+1] == 0:
-                self.move((x+1, y))
+            if 0 <= action < 4:
+                self.move_direction(action)
             elif action == 4:
                 self.handle_hint(no_draw)
 
@@ -2160,16 +4168,293 @@ class MazeGame:
         return False
 
 
-if __name__ == '__main__':
-    # 迷路の生成
-    maze, labels, start_goal_candidates = Analyzer.create_maze((30, 30), 50)
+class MazeGameBatch:
+    """
+    同じ迷路で複数のゲームを並べて同時に進める、描画なしの MazeGame です。強化学習で多数のゲームを進めるために使用します。
+    プレイヤーの位置・MP・視界・タイマー・アイテムの状態をゲームごとの配列（先頭の次元がゲームの番号）で、
+    すべてのゲームの敵を EnemyGroup で保持し、step を1回呼ぶとすべてのゲームを1フレーム進めます。
+
+    アクションの番号と1フレームの処理の順序は MazeGame.step（no_draw=True）と同じです。
+    乱数には random の代わりに seed から作る np.random.Generator を使うため、乱数列は MazeGame と一致しませんが、
+    スタートとゴール・アイテム・敵の出現位置と移動の確率分布は同じです。
+    終了したゲームは reset で再開するまで、終了時の状態のまま進みません。
+
+    使用例:
+            maze, labels, start_goal_candidates = Analyzer.create_maze((30, 30), 50, seed=0)
+            games = MazeGameBatch(maze, labels, start_goal_candidates, num_games=256, seed=0)
+            games.reset()
+            while not games.done.all():
+                # アクションの選択（0: 上, 1: 下, 2: 左, 3: 右, 4: ヒント, 5-8: テレポート, 9: 明るさ増加, 10+: アイテム使用）
+                actions = ...  # AIによってゲームごとのアクションを決定
+                done = games.step(actions)
+            print(games.score)
+    """
+    # 移動とテレポートの向き (dx, dy)（0: 上, 1: 下, 2: 左, 3: 右）
+    ACTION_DIRECTIONS = MoveTable.DIRECTIONS[:, ::-1]
+    ITEM_TYPES = [MonsterVisionItem, ExtraLightItem, PathfinderItem]
+    MAX_ITEMS = 2
+
+    def __init__(self, maze: ndarray, regions: ndarray, start_goal_candidates: dict[int, list[ndarray, ndarray]],
+                 num_games: int, seed: int | None = None) -> None:
+        """
+        引数:
+            maze (ndarray): 迷路の構造を表す2次元配列
+            regions (ndarray): 迷路の領域を表す2次元配列
+            start_goal_candidates (dict[int,list[ndarray,ndarray]]): 各領域のスタートとゴールの候補位置
+            num_games (int): 同時に進めるゲームの数
+            seed (int|None): 乱数のシード（オプション）
+        """
+        self.maze = maze.copy()
+        self.regions = regions
+        self.start_goal_candidates = start_goal_candidates
+        self.num_games = num_games
+        self.rng = np.random.default_rng(seed)
+        self.moves = MoveTable(self.maze)
+        self.region_cells = {region: np.argwhere(regions == region) for region in start_goal_candidates}
+
+        self.hint_duration = MazeGame.HINT_DURATION * MazeGame.FPS
+        self.restore_mpf = MazeGame.RESTORE_MP_PER_SECONDS / MazeGame.FPS
+        self.max_transparent_time = MazeGame.TRANSPARENT_DURATION * MazeGame.FPS
+        self.monster_adding_interval = MazeGame.MONSTER_ADDING_INTERVAL * MazeGame.FPS
+        self.sight_recovery_rate = MazeGame.RESTORE_SIGHT_PER_SECONDS / MazeGame.FPS
+        self.mp_to_brightness_rate = MazeGame.MP_FOR_BRIGHTNESS_VALUE_PER_SECOUNDS / MazeGame.FPS
+        self.mp_to_brightness_cost = MazeGame.MP_FOR_BRIGHTNESS_COST_PER_SECOUNDS / MazeGame.FPS
+        self.mp_to_brightness_decay = MazeGame.MP_FOR_BRIGHTNESS_DECAY_PER_SECOUNDS / MazeGame.FPS
+        self.enemy_damage = MazeGame.MAX_SIGHT / 2
+
+        items = [item_type() for item_type in MazeGameBatch.ITEM_TYPES]
+        self.item_names = [item.name for item in items]
+        self.item_cooldowns = np.array([item.cooldown for item in items])
+        self.item_durations = np.array([item.duration for item in items])
+        self.item_extra_lights = np.array([getattr(item, 'extra_light', 0) for item in items], dtype=float)
+
+        n, slots = num_games, MazeGameBatch.MAX_ITEMS
+        self.pos = np.zeros((n, 2), dtype=int)
+        self.goal_pos = np.zeros((n, 2), dtype=int)
+        self.region = np.zeros(n, dtype=int)
+        self.mp = np.zeros(n)
+        self.sight = np.zeros(n)
+        self.extra_sight = np.zeros(n)
+        self.mp_to_brightness_decaing = np.zeros(n, dtype=bool)
+        self.hint_timer = np.zeros(n, dtype=int)
+        self.transparent_timer = np.zeros(n, dtype=int)
+        self.monster_adding_time = np.zeros(n, dtype=int)
+        self.frames = np.zeros(n, dtype=int)
+        self.item_types = np.zeros((n, slots), dtype=int)
+        self.item_time = np.zeros((n, slots), dtype=int)
+        self.item_cooldown = np.zeros((n, slots), dtype=int)
+        self.item_extra_light = np.zeros((n, slots))
+        self.done = np.ones(n, dtype=bool)
+        self.goal_reached = np.zeros(n, dtype=bool)
+        self.score = np.zeros(n, dtype=int)
+        self.enemies = EnemyGroup(self.maze, n, self.rng, moves=self.moves)
+
+    @classmethod
+    def from_settings(cls, num_games: int, seed: int | None = None):
+        """
+        MazeGame.from_settings と同じ迷路で MazeGameBatch を作成します。
+
+        引数:
+            num_games (int): 同時に進めるゲームの数
+            seed (int|None): 乱数のシード（オプション）
+
+        戻り値:
+            MazeGameBatch: 作成されたゲーム
+        """
+        cache = MazeCache(MazeGame.MAZE_CACHE_DIR, MazeGame.MAZE_CACHE_MAX_BYTES)
+        maze, labels, start_goal_candidates = Analyzer.create_maze(
+            tuple(MazeGame.MAZE_SHAPE), MazeGame.MAZE_MIN_SIZE, MazeGame.MAZE_SEED, cache)
+        return cls(maze, labels, start_goal_candidates, num_games, seed)
+
+    def reset(self, games: ndarray | None = None):
+        """
+        指定したゲームを MazeGame.setup と同じ手順で初期化し、新しいゲームを開始します。
+
+        引数:
+            games (ndarray|None): 初期化するゲームの番号、またはゲームごとのブール配列（デフォルト: すべてのゲーム）
+        """
+        indices = np.arange(self.num_games) if games is None else np.arange(self.num_games)[games]
+        for game in indices:
+            self.mp[game] = MazeGame.MAX_MP
+            self.sight[game] = MazeGame.MAX_SIGHT
+            self.extra_sight[game] = 0
+            self.mp_to_brightness_decaing[game] = False
+            self.hint_timer[game] = 0
+            self.transparent_timer[game] = 0
+            self.monster_adding_time[game] = 0
+            self.frames[game] = 0
+            self.done[game] = False
+            self.goal_reached[game] = False
+            self.score[game] = 0
+
+            regions = list(self.start_goal_candidates.keys())
+            region = regions[self.rng.integers(len(regions))]
+            starts, goals = self.start_goal_candidates[region]
+            player_pos = starts[self.rng.integers(len(starts))]
+            goal_pos = goals[self.rng.integers(len(goals))]
+            self.region[game] = region
+            self.pos[game] = player_pos[::-1]
+            self.goal_pos[game] = goal_pos[::-1]
+
+            appear_mask = self.regions == region
+            appear_mask[player_pos] = False
+            self.enemies.clear(game)
+            self.enemies.add(game, np.argwhere(appear_mask), np.sum(self.regions == region) // 8)
+
+        # MazeGame.initialize_items と同じく、アイテムの種類の並びをシャッフルして先頭から割り当てる
+        order = np.argsort(self.rng.random((len(indices), len(MazeGameBatch.ITEM_TYPES))), axis=1)
+        self.item_types[indices] = order[:, :MazeGameBatch.MAX_ITEMS]
+        self.item_time[indices] = 0
+        self.item_cooldown[indices] = 0
+        self.item_extra_light[indices] = 0.0
+
+    def teleport(self, games: ndarray, select: ndarray):
+        """
+        指定したゲームのプレイヤーを MazeGame.teleport と同じ規則でテレポートさせます。
+
+        引数:
+            games (ndarray): ゲームの番号 (M,)
+            select (ndarray): テレポートの向き（0: 上, 1: 下, 2: 左, 3: 右）(M,)
+        """
+        max_distance = np.ceil(self.sight[games] / MazeGame.TELEPORT_SIGHT_COST_PER_DISTANCE).astype(int) - 1
+        movable = max_distance > 1
+        games, select, max_distance = games[movable], select[movable], max_distance[movable]
+        if len(games) == 0:
+            return
+        origin = self.pos[games]
+        step = MazeGameBatch.ACTION_DIRECTIONS[select]
+        # 壁にぶつかるか迷路の外に出る直前で停止
+        distance = np.minimum(max_distance, self.moves.wall_distance[select, origin[:, 1], origin[:, 0]])
+        # 着地点に敵がいる間は手前に戻す
+        hit = (distance > 0) & self.enemies.check_collision(games, origin + step * distance[:, None])
+        while hit.any():
+            distance[hit] -= 1
+            hit = (distance > 0) & self.enemies.check_collision(games, origin + step * distance[:, None])
+        moved = distance > 0
+        games, distance = games[moved], distance[moved]
+        self.transparent_timer[games] = self.max_transparent_time
+        self.pos[games] = origin[moved] + step[moved] * distance[:, None]
+        self.sight[games] -= distance * MazeGame.TELEPORT_SIGHT_COST_PER_DISTANCE
+        self.mp[games] -= MazeGame.TELEPORT_MP_COST
+
+    def update_items(self, running: ndarray):
+        """
+        進行中のゲームのアイテムの効果時間とクールダウンを、GameItem.update と同じ規則で1フレーム進めます。
+
+        引数:
+            running (ndarray): 進行中のゲームを表すブール配列
+        """
+        running = running[:, None]
+        busy = running & (self.item_time > 0)
+        extra_light = self.item_extra_lights[self.item_types] * ((self.item_time - 1) / self.item_durations[self.item_types])
+        self.item_extra_light = np.where(running, np.where(busy, extra_light, 0.0), self.item_extra_light)
+        self.item_time[busy] -= 1
+        self.item_cooldown[running & ~busy & (self.item_cooldown > 0)] -= 1
+
+    def get_total_sight(self) -> ndarray:
+        """
+        各ゲームの視界・明るさ増加・アイテムによる追加の視界の合計を返します（PlayerStatus.get_total_sight）。
+        """
+        return self.sight + self.extra_sight + self.item_extra_light.sum(axis=1)
+
+    def get_busy_item(self, item_name: str) -> ndarray:
+        """
+        各ゲームで指定した名前のアイテムが効果時間中かどうかを返します（PlayerStatus.get_busy_item）。
+        """
+        item_type = self.item_names.index(item_name)
+        return np.any((self.item_types == item_type) & (self.item_time > 0), axis=1)
+
+    def step(self, actions: ndarray, keep_press: ndarray | bool = False) -> ndarray:
+        """
+        すべての進行中のゲームを1ステップ進めます。MazeGame.step を各ゲームで呼ぶのと同じ処理をまとめて行います。
+
+        引数:
+            actions (ndarray): ゲームごとのアクション（0: 上, 1: 下, 2: 左, 3: 右, 4: ヒント, 5-8: テレポート, 9: 明るさ増加, 10+: アイテム使用）
+            keep_press (ndarray|bool): ゲームごと、または全体でボタンを押し続けているかどうか（デフォルト: False）
+
+        戻り値:
+            ndarray: ゲームごとに終了している場合にTrueとなるブール配列
+        """
+        actions = np.asarray(actions)
+        running = ~self.done
+        pressed = running & ~np.asarray(keep_press, dtype=bool)
+        bright_action = 9
+
+        # アイテムの使用
+        item_action = pressed & (actions > bright_action) & (actions <= bright_action + MazeGameBatch.MAX_ITEMS)
+        games = np.nonzero(item_action)[0]
+        slots = actions[games] - bright_action - 1
+        usable = (self.item_time[games, slots] == 0) & (self.item_cooldown[games, slots] == 0)
+        games, slots = games[usable], slots[usable]
+        item_types = self.item_types[games, slots]
+        self.item_cooldown[games, slots] = self.item_cooldowns[item_types]
+        self.item_time[games, slots] = self.item_durations[item_types]
+        self.item_extra_light[games, slots] = self.item_extra_lights[item_types]
+
+        # 移動とヒント
+        control = pressed & ~item_action & (self.extra_sight == 0)
+        direction = np.clip(actions, 0, 3)
+        move = control & (actions < 4) & self.moves.can_move(self.pos[:, ::-1], direction)
+        self.pos[move] += MazeGameBatch.ACTION_DIRECTIONS[direction[move]]
+        hint = control & (actions == 4) & (self.hint_timer <= 0) & (self.mp >= MazeGame.HINT_MP_COST)
+        self.hint_timer[hint] = self.hint_duration
+        self.mp[hint] = np.maximum(0, self.mp[hint] - MazeGame.HINT_MP_COST)
+
+        # 明るさ増加（MazeGame.handle_mp_to_brightness_for_ai）
+        bright = (running & (actions == bright_action) & (self.mp >= MazeGame.MP_FOR_BRIGHTNESS_COST_PER_SECOUNDS)
+                  & ~self.mp_to_brightness_decaing)
+        self.mp[bright] = np.maximum(0, self.mp[bright] - self.mp_to_brightness_cost)
+        self.extra_sight[bright] = np.maximum(0, self.extra_sight[bright] + self.mp_to_brightness_rate)
+        decay = running & ~bright & (self.extra_sight > 0)
+        self.extra_sight[decay] = np.maximum(0, self.extra_sight[decay] - self.mp_to_brightness_decay)
+        self.mp_to_brightness_decaing[decay] = self.extra_sight[decay] > 0
+
+        self.enemies.next(running)
+
+        # テレポート（MazeGame.handle_teleport_for_ai）
+        teleport = (pressed & (actions > 4) & (actions <= 8) & (self.mp >= MazeGame.TELEPORT_MP_COST)
+                    & (self.sight >= MazeGame.MIN_SIGHT_FOR_TELEPORT) & (self.extra_sight == 0))
+        if teleport.any():
+            self.teleport(np.nonzero(teleport)[0], actions[teleport] - 5)
+
+        self.transparent_timer[running & (self.transparent_timer > 0)] -= 1
+        self.update_items(running)
+
+        visible = running & (self.transparent_timer == 0)
+        adding = visible & (self.monster_adding_time >= self.monster_adding_interval)
+        self.monster_adding_time[visible & ~adding] += 1
+        self.monster_adding_time[adding] = 0
+        for game in np.nonzero(adding)[0]:
+            self.enemies.add(game, self.region_cells[self.region[game]], 1)
+        self.hint_timer[visible & (self.hint_timer > 0)] -= 1
+        self.mp[visible] = np.minimum(MazeGame.MAX_MP, self.mp[visible] + self.restore_mpf)
+        self.sight[visible] = np.minimum(MazeGame.MAX_SIGHT, self.sight[visible] + self.sight_recovery_rate)
+        games = np.nonzero(visible)[0]
+        hit = games[self.enemies.check_collision(games, self.pos[games])]
+        self.sight[hit] = np.maximum(0, self.sight[hit] - self.enemy_damage)
+        self.transparent_timer[hit] = self.max_transparent_time
+
+        # 終了判定とスコア（MazeGame.calculate_and_print_score、経過時間はフレーム数から計算）
+        self.frames[running] += 1
+        reached = running & np.all(self.pos == self.goal_pos, axis=1)
+        game_over = running & ~reached & (self.sight <= 0)
+        finished = reached | game_over
+        base_score = np.where(reached, 1000, -200)
+        time_penalty = (self.frames / MazeGame.FPS * 10).astype(int)
+        score = base_score - time_penalty + (self.sight * 100).astype(int) + (self.mp * 5).astype(int)
+        self.score[finished] = score[finished]
+        self.goal_reached |= reached
+        self.done |= finished
+        return self.done.copy()
 
-    # MazeGameインスタンスの作成
-    game = MazeGame(maze, labels, start_goal_candidates)
 
+if __name__ == '__main__':
     # 設定の読み込み（オプション）
     if os.path.exists("maze_config.json"):
-        game.load_config_from_json("maze_config.json")
+        MazeGame.load_config_from_json("maze_config.json")
+
+    # 迷路の生成（MAZE_SEEDが指定されていればキャッシュから読み込み）とMazeGameインスタンスの作成
+    game = MazeGame.from_settings()
 
     # ゲームの実行
     game.main()
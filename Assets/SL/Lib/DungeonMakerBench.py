@@ -0,0 +1,652 @@
+import argparse
+from collections import deque
+import contextlib
+import io
+import os
+import random
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+from numpy import ndarray
+from scipy import signal
+
+import DungeonMaker
+from DungeonMaker import (Analyzer, Constant, Enemy, EnemyGroup, FrameHistory, GoalField, MazeGame, MazeGameBatch,
+                          MoveTable, NeighborStencil, RegionTable)
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    """
+    funcをrepeat回実行し、1回あたりの平均実行時間（マイクロ秒）を返します。
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def grid_field(shape: tuple[int, int], cell: int) -> ndarray:
+    """
+    cell間隔の格子状の壁で区切られたフィールドを作成します（0: 通路, 1: 壁）。
+    """
+    field = np.zeros(shape, dtype=np.uint8)
+    field[cell::cell + 1, :] = 1
+    field[:, cell::cell + 1] = 1
+    return field
+
+
+def bench_region_sizes(shapes: list[tuple[int, int]], cell: int = 9, repeat: int = 200):
+    """
+    set_wall の最小サイズ判定と get_area_mask の領域選択にかかる1回あたりのコストを、
+    全体走査（np.sum）とサイズ表（RegionTable）で比較します。
+    サイズ表を使う場合はグリッドの面積に依存しないことを確認できます。
+    """
+    print(f"{'shape':>12} {'regions':>8} {'np.sum [us]':>12} {'table [us]':>12}")
+    for shape in shapes:
+        field = grid_field(shape, cell)
+        route_labels, labels, _ = Constant.get_labels(field)
+        regions = RegionTable(labels)
+        open_cells = np.argwhere(field == 0)
+        pos = tuple(open_cells[len(open_cells) // 2])
+
+        def full_scan():
+            np.sum(labels == labels[pos])
+            area_sizes = [np.sum(labels == rl) for rl in route_labels]
+            return route_labels[np.argmax(area_sizes)]
+
+        def table_lookup():
+            regions.size(labels[pos])
+            return regions.select_label(route_labels, 'max')
+
+        print(f"{str(shape):>12} {len(route_labels):>8} "
+              f"{measure(full_scan, max(1, repeat // len(route_labels))):>12.1f} "
+              f"{measure(table_lookup, repeat):>12.1f}")
+
+
+def bench_splitter_table(repeat: int = 20000):
+    """
+    is_potential_splitter の表引き版が、全ての3x3パターン（中心と周囲8セルの2^9通り）で
+    元の実装と同じ結果を返すことを確認し、1回あたりの判定コストを比較します。
+    """
+    c = Constant()
+    for pattern in range(512):
+        extracted_field = np.array([(pattern >> k) & 1 for k in range(9)]).reshape(3, 3)
+        code = Constant.extract_surrounding_efficient((1, 1), extracted_field, return_code=True)
+        expected = c.is_potential_splitter(extracted_field)
+        actual = extracted_field[1, 1] != 1 and c.is_potential_splitter_code(code)
+        assert expected == actual, f"pattern {pattern:09b}: expected {expected}, got {actual}"
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        field = rng.integers(0, 2, size=(5, 6))
+        for pos in np.ndindex(field.shape):
+            if field[pos] == 1:
+                continue
+            code = Constant.extract_surrounding_efficient(pos, field, return_code=True)
+            expected = c.is_potential_splitter(Constant.extract_surrounding_efficient(pos, field))
+            assert expected == c.is_potential_splitter_code(code), f"field {field.tolist()}, pos {pos}"
+    print("is_potential_splitter_code matches is_potential_splitter for all 512 patterns and at the borders")
+
+    field = grid_field((64, 64), 5)
+    pos = (4, 4)
+
+    def mask_algebra():
+        return c.is_potential_splitter(Constant.extract_surrounding_efficient(pos, field))
+
+    def table_lookup():
+        return c.is_potential_splitter_code(Constant.extract_surrounding_efficient(pos, field, return_code=True))
+
+    print(f"mask algebra: {measure(mask_algebra, repeat):.2f} us, table: {measure(table_lookup, repeat):.2f} us")
+
+
+def maze_field(shape: tuple[int, int], min_size: int = 50, seed: int = 0):
+    """
+    create_maze と同じ密度で auto_setting を行ったフィールドを作成します。
+
+    戻り値:
+        tuple: (フィールド, ルートのラベル, 各セルのラベル)
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    field = np.zeros(shape)
+    return Constant().auto_setting(field, min_size, shape[0] * shape[1] // 3, inplace=True)[-1]
+
+
+def bench_difficulty_solver(shapes: list[tuple[int, int]], steps: int = 5000, substeps: list[int] = [50, 200, 1000]):
+    """
+    Analyzer.difficulty の陽解法（基準）と疎行列による陰解法の実行時間と誤差を比較します。
+    誤差は陽解法の結果に対する相対L2誤差と最大絶対誤差、極大値の位置の一致率（Jaccard係数）です。
+    """
+    print(f"{'shape':>12} {'solver':>16} {'time [s]':>9} {'rel L2':>9} {'max abs':>9} {'peaks':>6}")
+    for shape in shapes:
+        field, route_labels, labels = maze_field(shape)
+        mask = field == 0
+
+        def run(**options):
+            start = time.perf_counter()
+            R, _ = Analyzer.difficulty(field, steps=steps, target_labels=route_labels, labels=labels, **options)
+            return R, time.perf_counter() - start
+
+        reference, elapsed = run()
+        reference_peaks = Constant.get_peak2D(reference, mask, 'maximum')
+        print(f"{str(shape):>12} {'explicit':>16} {elapsed:>9.3f}")
+        for n in substeps:
+            for linear_solver in ['direct', 'cg']:
+                R, elapsed = run(solver='implicit', substeps=n, linear_solver=linear_solver)
+                peaks = Constant.get_peak2D(R, mask, 'maximum')
+                jaccard = np.sum(peaks & reference_peaks) / max(1, np.sum(peaks | reference_peaks))
+                print(f"{'':>12} {f'{linear_solver}/{n}':>16} {elapsed:>9.3f} "
+                      f"{np.linalg.norm(R - reference) / np.linalg.norm(reference):>9.2e} "
+                      f"{np.max(np.abs(R - reference)):>9.2e} {jaccard:>6.2f}")
+
+
+def step_allocation(func: Callable[[], object], repeat: int) -> float:
+    """
+    funcを1回実行するたびに一時的に確保されたメモリの最大量（バイト）の平均を返します。
+    """
+    func()
+    tracemalloc.start()
+    total = 0
+    for _ in range(repeat):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return total / repeat
+
+
+def bench_stencil(shapes: list[tuple[int, int]], repeat: int = 200):
+    """
+    difficulty, fluid, simulate_light_propagation の1反復を、以前の実装（np.pad + convolve2d, np.stack + np.roll）と
+    NeighborStencil を使う実装で比較します。1反復あたりの時間と、1反復で一時的に確保されるメモリの量を表示します。
+    """
+    print(f"{'shape':>12} {'loop':>10} {'old [us]':>10} {'new [us]':>10} {'old [B]':>10} {'new [B]':>8}")
+    for shape in shapes:
+        field, _, _ = maze_field(shape)
+        mask = field == 0
+        rng = np.random.default_rng(0)
+        R = rng.random(shape) * mask
+        stable = rng.random(shape)
+        count_table = Analyzer.neighbor_count(field)
+        kernel = 0.25 * np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]])
+        light_kernel = np.array([[0, 0.5, 0], [0.5, 1, 0.5], [0, 0.5, 0]]) / 3
+
+        stencil = NeighborStencil(shape)
+        band = stencil.band(stencil.pad(R))
+        update = np.empty_like(band)
+        open_cells = stencil.band(stencil.pad(mask, float))
+        neighbor_count = stencil.band(stencil.pad(count_table * 0.25))
+        stable_mask = stencil.band(stencil.pad(stable * mask))
+        inflow = stencil.band(stencil.pad(0.5 / (count_table + 1)))
+        outflow = stencil.band(stencil.pad(0.5 * stable * count_table / (count_table + 1)))
+
+        def difficulty_old():
+            laplacian = signal.convolve2d(np.pad(R, 1, mode='constant', constant_values=0), kernel, mode='valid')
+            R[mask] += laplacian[mask] - count_table[mask] * 0.25 * R[mask]
+            R[~mask] = 0
+
+        def difficulty_new():
+            np.multiply(band, 0.25, out=stencil.source_band)
+            laplacian = stencil.neighbor_sum()
+            np.multiply(neighbor_count, band, out=update)
+            np.subtract(laplacian, update, out=update)
+            np.add(band, update, out=band)
+            np.multiply(band, open_cells, out=band)
+
+        def fluid_old():
+            neighbor_sum = np.sum(np.stack([np.roll(R * stable * mask, (i, j), (0, 1))
+                                            for i, j in [(0, 1), (0, -1), (1, 0), (-1, 0)]]), axis=0)
+            R[...] += 0.5 * neighbor_sum / (count_table + 1) - 0.5 * R * stable * (count_table / (count_table + 1))
+
+        def fluid_new():
+            np.multiply(band, stable_mask, out=stencil.source_band)
+            neighbor_sum = stencil.neighbor_sum()
+            np.multiply(neighbor_sum, inflow, out=update)
+            np.add(band, update, out=band)
+            np.multiply(band, outflow, out=update)
+            np.subtract(band, update, out=band)
+
+        def light_old():
+            R[...] = signal.convolve2d(R * mask, light_kernel, mode='same')
+            R[~mask] = 0
+
+        def light_new():
+            np.multiply(band, open_cells, out=stencil.source_band)
+            neighbor_sum = stencil.neighbor_sum()
+            np.multiply(stencil.source_band, 1 / 3, out=band)
+            np.multiply(neighbor_sum, 0.5 / 3, out=neighbor_sum)
+            np.add(band, neighbor_sum, out=band)
+            np.multiply(band, open_cells, out=band)
+
+        for name, old, new in [('difficulty', difficulty_old, difficulty_new),
+                               ('fluid', fluid_old, fluid_new),
+                               ('light', light_old, light_new)]:
+            print(f"{str(shape):>12} {name:>10} {measure(old, repeat):>10.1f} {measure(new, repeat):>10.1f} "
+                  f"{step_allocation(old, repeat):>10.0f} {step_allocation(new, repeat):>8.0f}")
+
+
+def bench_area_crops(shapes: list[tuple[int, int]], cells: list[int] = [4, 9, 19], repeat: int = 3):
+    """
+    エリアごとの処理（difficulty の RN2C による正規化）を、フィールド全体のマスクを作る apply_each_areas と
+    外接矩形の上で行う apply_each_crops で比較します。格子状の壁で区切った、小さいエリアが多いフィールドを使います。
+    """
+    print(f"{'shape':>12} {'cell':>5} {'areas':>6} {'areas [ms]':>11} {'crops [ms]':>11} {'same':>5}")
+    for shape in shapes:
+        for cell in cells:
+            field = grid_field(shape, cell)
+            route_labels, labels, _ = Constant.get_labels(field)
+            score = Analyzer.delta_score(field)
+            by_areas = score.copy()
+            by_crops = score.copy()
+
+            def norm_areas():
+                def norm(selector, lbl):
+                    by_areas[selector] = Constant.RN2C(score[selector])
+                Analyzer.apply_each_areas(route_labels, labels, norm)
+
+            def norm_crops():
+                def norm(crop, selector, lbl):
+                    by_crops[crop][selector] = Constant.RN2C(score[crop][selector])
+                Analyzer.apply_each_crops(route_labels, labels, norm)
+
+            old = measure(norm_areas, repeat) / 1e3
+            new = measure(norm_crops, repeat) / 1e3
+            print(f"{str(shape):>12} {cell:>5} {len(route_labels):>6} {old:>11.1f} {new:>11.1f} "
+                  f"{str(np.array_equal(by_areas, by_crops)):>5}")
+
+
+def bench_area_workers(shapes: list[tuple[int, int]], cell: int = 39, steps: int = 5000, workers: list[int] = [1, 2, 4]):
+    """
+    create_maze の解析（difficulty から set_start_goal まで）を、フィールド全体で1度に行う場合と、
+    Analyzer.analyze_areas でエリアごとにスレッドプールとプロセスプールで行う場合で比較し、結果が一致することを確認します。
+    格子状の壁で区切った、数十個のエリアを持つフィールドを使い、すべてのエリアを対象にする場合と
+    1つおきのエリアだけを対象にする場合（対象外のエリアの難易度スコアも比較します）を計算します。
+    """
+    print(f"{'shape':>12} {'areas':>6} {'targets':>8} {'executor':>9} {'workers':>8} {'time [s]':>9} {'same':>5}")
+    for shape in shapes:
+        field = grid_field(shape, cell).astype(float)
+        all_labels, labels, _ = Constant.get_labels(field)
+        for route_labels in [all_labels, all_labels[::2]]:
+            start = time.perf_counter()
+            d_score, _ = Analyzer.difficulty(field, steps=steps, target_labels=route_labels, labels=labels, history=FrameHistory('none'))
+            _, _, normalized_peak_value = Analyzer.difficulty_peaks(field, d_score, target_labels=route_labels, labels=labels)
+            _, _, fluid_label = Analyzer.fluid_difficulty(field, steps=steps, normalized_peak_value=normalized_peak_value,
+                                                          target_labels=route_labels, labels=labels, history=FrameHistory('none'))
+            _, points = Analyzer.set_start_goal(field, fluid_label, normalized_peak_value, route_labels, labels)
+            print(f"{str(shape):>12} {len(all_labels):>6} {len(route_labels):>8} {'serial':>9} {'':>8} {time.perf_counter() - start:>9.2f}")
+            for executor in ['thread', 'process']:
+                for n in workers:
+                    start = time.perf_counter()
+                    result = Analyzer.analyze_areas(field, route_labels, labels, steps=steps, workers=n, executor=executor)
+                    elapsed = time.perf_counter() - start
+                    same = (np.array_equal(result[0], d_score) and np.array_equal(result[1], normalized_peak_value)
+                            and np.array_equal(result[2], fluid_label)
+                            and all(np.array_equal(a, b) for lbl in points for a, b in zip(points[lbl], result[4][lbl])))
+                    print(f"{'':>12} {'':>6} {'':>8} {executor:>9} {n:>8} {elapsed:>9.2f} {str(same):>5}")
+
+
+def bench_batch(shapes: list[tuple[int, int]], n: int = 100, steps: int = 5000):
+    """
+    同じ大きさのn個の迷路を1つずつ解析する場合と、(n, 高さ, 幅) に重ねてまとめて解析する場合の
+    neighbor_count, delta_score, difficulty, fluid の合計時間を比較し、結果が一致することを確認します。
+    """
+    print(f"{'shape':>12} {'n':>5} {'function':>15} {'single [s]':>11} {'batch [s]':>10} {'same':>5}")
+    for shape in shapes:
+        mazes = [maze_field(shape, seed=seed) for seed in range(n)]
+        fields = np.stack([field for field, _, _ in mazes])
+        route_labels = [route_labels for _, route_labels, _ in mazes]
+        labels = np.stack([labels for _, _, labels in mazes])
+
+        def compare(name, single, batch):
+            start = time.perf_counter()
+            singles = [single(i) for i in range(n)]
+            single_time = time.perf_counter() - start
+            start = time.perf_counter()
+            batched = batch()
+            batch_time = time.perf_counter() - start
+            same = all(np.array_equal(a, b) for a, b in zip(singles, batched))
+            print(f"{str(shape):>12} {n:>5} {name:>15} {single_time:>11.3f} {batch_time:>10.3f} {str(same):>5}")
+            return batched
+
+        compare('neighbor_count', lambda i: Analyzer.neighbor_count(fields[i]), lambda: Analyzer.neighbor_count(fields))
+        compare('delta_score', lambda i: Analyzer.delta_score(fields[i]), lambda: Analyzer.delta_score(fields))
+        d_scores = compare('difficulty',
+                           lambda i: Analyzer.difficulty(fields[i], steps=steps, target_labels=route_labels[i], labels=labels[i],
+                                                         history=FrameHistory('none'))[0],
+                           lambda: Analyzer.difficulty(fields, steps=steps, target_labels=route_labels, labels=labels,
+                                                       history=FrameHistory('none'))[0])
+        sources, stable = map(np.stack, zip(*[
+            Analyzer.fluid_sources(fields[i], Analyzer.difficulty_peaks(fields[i], d_scores[i], route_labels[i], labels[i])[2],
+                                   target_labels=route_labels[i], labels=labels[i]) for i in range(n)]))
+        compare('fluid',
+                lambda i: Analyzer.fluid(sources[i], stable[i], fields[i] == 0, steps, 3.0, -3.0, history=FrameHistory('none'))[2],
+                lambda: Analyzer.fluid(sources, stable, fields == 0, steps, 3.0, -3.0, history=FrameHistory('none'))[2])
+
+
+def bench_compute_dtype(shapes: list[tuple[int, int]], seeds: int = 5, steps: int = 5000):
+    """
+    difficulty と fluid を float64 と float32 で計算し、実行時間と差を比較します。
+    差は難易度の最大絶対誤差（float64 の最大絶対値に対する比）、到達ステップが変わったセルの割合と最大の差、
+    set_start_goal が選ぶスタートとゴールの一致率です。
+    """
+    print(f"{'shape':>12} {'dtype':>8} {'diff [s]':>9} {'fluid [s]':>10} {'diff err':>9} {'changed':>8} "
+          f"{'max step':>9} {'sg same':>8}")
+    for shape in shapes:
+        results = {}
+        for dtype in [np.float64, np.float32]:
+            times = np.zeros(2)
+            results[dtype] = []
+            for seed in range(seeds):
+                field, route_labels, labels = maze_field(shape, seed=seed)
+                start = time.perf_counter()
+                d_score, _ = Analyzer.difficulty(field, steps=steps, target_labels=route_labels, labels=labels,
+                                                 history=FrameHistory('none'), dtype=dtype)
+                times[0] += time.perf_counter() - start
+                _, _, normalized_peak_value = Analyzer.difficulty_peaks(field, d_score, route_labels, labels)
+                sources, stable = Analyzer.fluid_sources(field, normalized_peak_value, target_labels=route_labels, labels=labels)
+                start = time.perf_counter()
+                _, _, filled_steps = Analyzer.fluid(sources, stable, field == 0, steps, 3.0, -3.0, history=FrameHistory('none'),
+                                                    normalize=False, dtype=dtype)
+                times[1] += time.perf_counter() - start
+                filled = Analyzer.normalize_filled_steps(filled_steps.copy(), field == 0)
+                _, points = Analyzer.set_start_goal(field, filled, normalized_peak_value, route_labels, labels)
+                results[dtype].append((d_score, filled_steps, points))
+            line = f"{str(shape):>12} {np.dtype(dtype).name:>8} {times[0] / seeds:>9.3f} {times[1] / seeds:>10.3f}"
+            if dtype is np.float32:
+                errors, changed, max_step, same, areas = [], [], 0, 0, 0
+                for (d64, s64, p64), (d32, s32, p32) in zip(results[np.float64], results[np.float32]):
+                    errors.append(np.max(np.abs(d32 - d64)) / np.max(np.abs(d64)))
+                    changed.append(np.mean(s32 != s64))
+                    max_step = max(max_step, np.max(np.abs(s32 - s64)))
+                    for lbl in p64:
+                        areas += 1
+                        same += all(np.array_equal(a, b) for a, b in zip(p64[lbl], p32[lbl]))
+                line += f" {max(errors):>9.1e} {np.mean(changed):>8.2%} {max_step:>9.0f} {same / areas:>8.0%}"
+            print(line)
+
+
+def copy_game_to_batch(game: MazeGame, games: MazeGameBatch, index: int):
+    """
+    セットアップ済みの MazeGame のプレイヤー・アイテム・敵の状態を MazeGameBatch の index 番目のゲームに写します。
+    """
+    games.reset([index])
+    games.pos[index] = game.player.pos
+    games.goal_pos[index] = game.goal_pos
+    games.region[index] = game.region
+    for slot, item in enumerate(game.player.items):
+        games.item_types[index, slot] = MazeGameBatch.ITEM_TYPES.index(type(item))
+    source, count = game.enemies, game.enemies.count[0]
+    games.enemies.clear(index)
+    games.enemies.add(index, source.pos[0, :count], count)
+    games.enemies.pos[index, :count] = source.pos[0, :count]
+    games.enemies.direc[index, :count] = source.direc[0, :count]
+    games.enemies.move_type[index, :count] = source.move_type[0, :count]
+    games.enemies.update_occupancy()
+
+
+def bench_game_batch(shape: tuple[int, int], num_games: list[int] = [1, 16, 256], steps: int = 300, check_steps: int = 3000):
+    """
+    MazeGame.step をゲームごとにループで呼ぶ場合と MazeGameBatch.step で、1秒あたりに進められるゲームのステップ数を比較します。
+    終了したゲームはその場で初期化して続けます。
+    また、敵を止めた（速度0）同じ初期状態のゲームを同じアクション列で進め、プレイヤーの状態が MazeGame と一致することを確認します。
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    maze, labels, start_goal_candidates = Analyzer.create_maze(shape, 50, seed=0)
+    actions_range = 10 + MazeGameBatch.MAX_ITEMS
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    rng = np.random.default_rng(0)
+    mismatches = 0
+    with quiet:
+        for trial in range(5):
+            random.seed(trial)
+            game = MazeGame(maze, labels, start_goal_candidates)
+            game.setup(no_draw=True)
+            game.enemies.v = 0.0
+            games = MazeGameBatch(maze, labels, start_goal_candidates, 1, seed=trial)
+            games.enemies.v = 0.0
+            copy_game_to_batch(game, games, 0)
+            count = len(game.enemies)
+            for _ in range(check_steps):
+                action, keep_press = rng.integers(actions_range), rng.random() < 0.1
+                done = game.step(action, keep_press)
+                games.step(np.array([action]), keep_press)
+                # 途中で追加される敵は位置が乱数で決まるため、両方から取り除く
+                game.enemies.clear(0, count)
+                games.enemies.clear(0, count)
+                player = game.player
+                same = (tuple(games.pos[0]) == player.pos and games.mp[0] == player.mp and games.sight[0] == player.sight
+                        and games.extra_sight[0] == player.extra_sight and games.hint_timer[0] == game.hint_timer
+                        and games.transparent_timer[0] == player.transparent_timer
+                        and games.get_total_sight()[0] == player.get_total_sight()
+                        and list(games.item_time[0]) == [item.current_time for item in player.items]
+                        and list(games.item_cooldown[0]) == [item.current_cooldown for item in player.items]
+                        and games.done[0] == done)
+                if not same:
+                    mismatches += 1
+                    break
+                if done:
+                    break
+    print(f"shape {shape}: state mismatches against MazeGame.step: {mismatches} / 5")
+
+    print(f"{'games':>6} {'loop [steps/s]':>15} {'batch [steps/s]':>16} {'speedup':>8}")
+    for n in num_games:
+        with quiet:
+            random.seed(0)
+            game_list = [MazeGame(maze, labels, start_goal_candidates) for _ in range(n)]
+            for game in game_list:
+                game.setup(no_draw=True)
+            actions = rng.integers(actions_range, size=(steps, n))
+            start = time.perf_counter()
+            for t in range(steps):
+                for game, action in zip(game_list, actions[t]):
+                    if game.step(action, False):
+                        game.setup(no_draw=True)
+            loop = steps * n / (time.perf_counter() - start)
+
+            games = MazeGameBatch(maze, labels, start_goal_candidates, n, seed=0)
+            games.reset()
+            start = time.perf_counter()
+            for t in range(steps):
+                done = games.step(actions[t])
+                if done.any():
+                    games.reset(done)
+            batch = steps * n / (time.perf_counter() - start)
+        print(f"{n:>6} {loop:>15.0f} {batch:>16.0f} {batch / loop:>7.1f}x")
+
+
+def bench_enemy_group(shape: tuple[int, int], counts: list[int] = [50, 200, 1000], frames: int = 300, samples: int = 4000):
+    """
+    Enemy のリストを1体ずつ進める場合と EnemyGroup でまとめて進める場合の、1フレームあたりの時間を比較します。
+    衝突の判定（プレイヤーの位置に敵がいるか）についても、リストを走査する場合と occupancy を引く場合の時間を比較し、
+    frames フレーム進めた後の occupancy が敵の位置から作り直したものと一致することを確認します。
+    また、移動タイプごとに同じ位置から多数の敵を進め、frames フレーム後の位置の分布の全変動距離を求めます。
+    比較の基準として、Enemy どうしを別の乱数で進めた場合の全変動距離も表示します。
+    """
+    field, _, _ = maze_field(shape)
+    maze = field.astype(np.uint8)
+    poses = np.argwhere(maze == 0)
+    print(f"{'enemies':>8} {'Enemy [us]':>11} {'group [us]':>11} {'speedup':>8} {'hit list [us]':>14} {'hit grid [us]':>14} "
+          f"{'grid ok':>8}")
+    for count in counts:
+        random.seed(0)
+        enemies = [Enemy(poses[random.randrange(len(poses))]) for _ in range(count)]
+
+        def step_objects():
+            for enemy in enemies:
+                enemy.next(maze)
+        group = EnemyGroup(maze, rng=np.random.default_rng(0))
+        group.add(0, poses, count)
+        t_objects = measure(step_objects, frames)
+        t_group = measure(group.next, frames)
+        # 敵のいないマス（リストを最後まで走査する場合）で比較する
+        empty = poses[group.occupancy[0][tuple(poses.T)] == 0]
+        player_pos = tuple((empty if len(empty) else poses)[0][::-1])
+        t_hit_list = measure(lambda: any(player_pos == enemy.get_game_pos() for enemy in enemies), frames)
+        t_hit_grid = measure(lambda: group.occupancy[0, player_pos[1], player_pos[0]] > 0, frames)
+        occupancy = group.occupancy.copy()
+        group.update_occupancy()
+        grid_ok = np.array_equal(occupancy, group.occupancy)
+        print(f"{count:>8} {t_objects:>11.1f} {t_group:>11.1f} {t_objects / t_group:>7.1f}x {t_hit_list:>14.1f} "
+              f"{t_hit_grid:>14.2f} {str(grid_ok):>8}")
+
+    def distribution(positions: ndarray) -> ndarray:
+        hist = np.zeros(maze.size)
+        np.add.at(hist, np.ravel_multi_index(tuple(positions.T), maze.shape), 1)
+        return hist / len(positions)
+
+    start = tuple(poses[len(poses) // 2])
+    print(f"{'move type':>26} {'TV group':>9} {'TV Enemy':>9}")
+    for move_type in EnemyGroup.MOVE_TYPES:
+        results = []
+        for seed in range(2):
+            random.seed(seed)
+            enemies = [Enemy(start, move_type) for _ in range(samples)]
+            for _ in range(frames):
+                for enemy in enemies:
+                    enemy.next(maze)
+            results.append(distribution(np.array([enemy.pos for enemy in enemies])))
+        group = EnemyGroup(maze, rng=np.random.default_rng(0))
+        group.add(0, np.array([start]), samples, move_type)
+        for _ in range(frames):
+            group.next()
+        grouped = distribution(group.pos[0, :samples])
+        print(f"{move_type:>26} {np.abs(grouped - results[0]).sum() / 2:>9.3f} {np.abs(results[1] - results[0]).sum() / 2:>9.3f}")
+
+
+def bench_move_table(shapes: list[tuple[int, int]], repeat: int = 2000):
+    """
+    MoveTable の作成時間と、テレポートの距離の制限（壁までのマス数）をマスごとに走査する場合と表を引く場合の1回あたりの時間を比較します。
+    表はすべての通路のマスと向きについて、走査した結果と一致することを確認します。
+    """
+    print(f"{'shape':>12} {'build [ms]':>11} {'scan [us]':>10} {'table [us]':>11} {'table ok':>9}")
+    for shape in shapes:
+        field, _, _ = maze_field(shape)
+        maze = field.astype(np.uint8)
+        start = time.perf_counter()
+        moves = MoveTable(maze)
+        build = (time.perf_counter() - start) * 1e3
+
+        def scan(i: int, j: int, direction: int, max_distance: int) -> int:
+            di, dj = MoveTable.DIRECTIONS[direction]
+            for distance in range(1, max_distance + 1):
+                ni, nj = i + di * distance, j + dj * distance
+                if ni < 0 or ni >= maze.shape[0] or nj < 0 or nj >= maze.shape[1] or maze[ni, nj] == 1:
+                    return distance - 1
+            return max_distance
+
+        poses = np.argwhere(maze == 0)
+        table_ok = all(moves.wall_distance[direction, i, j] == scan(i, j, direction, max(shape))
+                       for i, j in poses for direction in range(len(MoveTable.DIRECTIONS)))
+        i, j = poses[len(poses) // 2]
+        t_scan = measure(lambda: scan(i, j, 3, 3), repeat)
+        t_table = measure(lambda: min(3, moves.wall_distance[3, i, j].item()), repeat)
+        print(f"{str(shape):>12} {build:>11.2f} {t_scan:>10.2f} {t_table:>11.2f} {str(table_ok):>9}")
+
+
+def bfs_shortest_path(maze: ndarray, start: tuple[int, int], goal: tuple[int, int], max_depth: int | float):
+    """
+    以前の MazeGame.shortest_path と同じ、キューの各要素に経路のリストを持たせる幅優先探索です（比較用）。
+    """
+    queue = deque([(start, [start])])
+    visited = {start}
+    while queue:
+        (i, j), path = queue.popleft()
+        if (i, j) == goal:
+            return path[:max_depth] if len(path) >= max_depth else path
+        for di, dj in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
+            ni, nj = i + di, j + dj
+            if 0 <= ni < maze.shape[0] and 0 <= nj < maze.shape[1] and maze[ni, nj] == 0 and (ni, nj) not in visited:
+                queue.append(((ni, nj), path + [(ni, nj)]))
+                visited.add((ni, nj))
+    return None
+
+
+def bench_goal_field(shapes: list[tuple[int, int]], queries: int = 50):
+    """
+    スタートからの幅優先探索で毎回経路を求める場合と、GoalField を1回作って親を辿る場合の時間を比較します。
+    経路の問い合わせは Pathfinder の表示と同じく max_depth で切り詰めたもの（4）と、切り詰めないものの両方を測ります。
+    すべての問い合わせで経路の長さが一致することを確認します。
+    """
+    print(f"{'shape':>12} {'build [ms]':>11} {'bfs [us]':>9} {'field [us]':>11} {'bfs 4 [us]':>11} {'field 4 [us]':>13} "
+          f"{'same len':>9}")
+    for shape in shapes:
+        field, _, _ = maze_field(shape)
+        maze = field.astype(np.uint8)
+        moves = MoveTable(maze)
+        poses = [tuple(p) for p in np.argwhere(maze == 0).tolist()]
+        rng = np.random.default_rng(0)
+        goal = poses[rng.integers(len(poses))]
+        starts = [poses[k] for k in rng.integers(len(poses), size=queries)]
+        start = time.perf_counter()
+        goal_field = GoalField(moves, goal)
+        build = (time.perf_counter() - start) * 1e3
+        times = {}
+        for max_depth in [float('inf'), 4]:
+            times['bfs', max_depth] = measure(lambda: [bfs_shortest_path(maze, p, goal, max_depth) for p in starts], 1) / queries
+            times['field', max_depth] = measure(lambda: [goal_field.path(p, max_depth) for p in starts], 1) / queries
+        same = all((a is None and b is None) or (a is not None and b is not None and len(a) == len(b))
+                   for max_depth in [float('inf'), 4]
+                   for a, b in ((bfs_shortest_path(maze, p, goal, max_depth), goal_field.path(p, max_depth)) for p in starts))
+        print(f"{str(shape):>12} {build:>11.2f} {times['bfs', float('inf')]:>9.1f} {times['field', float('inf')]:>11.1f} "
+              f"{times['bfs', 4]:>11.1f} {times['field', 4]:>13.1f} {str(same):>9}")
+
+
+def bench_tiled(shapes: list[tuple[int, int]], workers: list[int] = [1, 2, 4], tile_shape: tuple[int, int] = (128, 128)):
+    """
+    auto_setting_tiled の実行時間をワーカー数ごとに測ります。
+    また、タイルの生成（generate_tile を1プロセスで順に実行）と境界の調整（adjust_seams）の時間を別々に測ります。
+    タイルの生成はワーカー数で分割でき、境界の調整は1プロセスで行うため、
+    「タイルの生成 / ワーカー数 + 境界の調整」が並列化したときの実行時間の目安になります（est の列）。
+    ワーカー数がCPUコア数を超える場合、w= の列には並列化の効果は現れません。
+    """
+    print(f"CPU cores: {os.cpu_count()}")
+    print(f"{'shape':>14} {'tiles [s]':>10} {'seam [s]':>9} " + " ".join(f"{f'w={w} [s]':>10}" for w in workers)
+          + " " + " ".join(f"{f'est {w} [s]':>11}" for w in workers))
+    for shape in shapes:
+        rows, cols = shape
+        field = np.zeros(shape, dtype=np.uint8)
+        start = time.perf_counter()
+        for k, (i, j) in enumerate((i, j) for i in range(0, rows, tile_shape[0]) for j in range(0, cols, tile_shape[1])):
+            h, w = min(tile_shape[0], rows - i), min(tile_shape[1], cols - j)
+            field[i:i+h, j:j+w] = DungeonMaker.generate_tile((h, w), 50, int(h * w / 3), k)
+        t_tiles = time.perf_counter() - start
+        start = time.perf_counter()
+        Constant().adjust_seams(field, 50, tile_shape, seed=0)
+        t_seam = time.perf_counter() - start
+        totals = []
+        for w in workers:
+            start = time.perf_counter()
+            Constant().auto_setting_tiled(shape, 50, tile_shape=tile_shape, workers=w, seed=0)
+            totals.append(time.perf_counter() - start)
+        print(f"{str(shape):>14} {t_tiles:>10.1f} {t_seam:>9.1f} " + " ".join(f"{t:>10.1f}" for t in totals)
+              + " " + " ".join(f"{t_tiles / w + t_seam:>11.1f}" for w in workers))
+
+
+BENCHMARKS = {
+    'region_sizes': lambda args: bench_region_sizes([(s, s) for s in args.sizes]),
+    'splitter_table': lambda args: bench_splitter_table(),
+    'difficulty_solver': lambda args: bench_difficulty_solver([(s, s) for s in args.sizes], args.steps),
+    'stencil': lambda args: bench_stencil([(s, s) for s in args.sizes]),
+    'area_crops': lambda args: bench_area_crops([(s, s) for s in args.sizes]),
+    'area_workers': lambda args: bench_area_workers([(s, s) for s in args.sizes], steps=args.steps),
+    'batch': lambda args: bench_batch([(s, s) for s in args.sizes], steps=args.steps),
+    'compute_dtype': lambda args: bench_compute_dtype([(s, s) for s in args.sizes], steps=args.steps),
+    'game_batch': lambda args: [bench_game_batch((s, s)) for s in args.sizes],
+    'enemy_group': lambda args: [bench_enemy_group((s, s)) for s in args.sizes],
+    'move_table': lambda args: bench_move_table([(s, s) for s in args.sizes]),
+    'goal_field': lambda args: bench_goal_field([(s, s) for s in args.sizes]),
+    'tiled': lambda args: bench_tiled([(s, s) for s in args.sizes], workers=args.workers),
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="DungeonMaker のベンチマーク")
+    parser.add_argument('benchmark', choices=list(BENCHMARKS.keys()))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 200, 400])
+    parser.add_argument('--steps', type=int, default=Analyzer.MAZE_DIFFUSION_STEPS)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+    DungeonMaker.SHOW_PROGRESS = False
+    BENCHMARKS[args.benchmark](args)